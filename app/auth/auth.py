@@ -1,16 +1,44 @@
+import hashlib
+import logging
+import time
+
 import jwt
 from fastapi import HTTPException, Request
+from redis.exceptions import RedisError
 
 from app.core.config import settings
+from app.core.redis import get_redis
+from app.utils.local_cache import LocalCache
 
+logger = logging.getLogger(__name__)
 
-def get_jwt_payload(request: Request):
+# Verified payloads, each kept until its token expires.
+token_cache = LocalCache(max_entries=settings.AUTH_TOKEN_CACHE_SIZE, max_bytes=2**63, ttl=0)
+# Results of deny-list lookups, so Redis is asked at most once per interval and token.
+revocation_cache = LocalCache(
+    max_entries=settings.AUTH_TOKEN_CACHE_SIZE,
+    max_bytes=2**63,
+    ttl=settings.AUTH_REVOCATION_CHECK_INTERVAL,
+)
+
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _revocation_key(token_hash: str) -> str:
+    return f'auth:revoked:{token_hash}'
+
+
+def verify_token(token: str) -> dict:
     """
-    Extract and verify JWT token from the cookie.
+    Verify a JWT token and return its payload. Verified payloads are cached until the
+    token expires, so repeated requests with the same token skip the signature check.
     """
-    token = request.cookies.get('auth')
-    if not token:
-        raise HTTPException(status_code=401, detail='Missing authentication token')
+    token_hash = _token_hash(token)
+    payload = token_cache.get(token_hash)
+    if payload is not None:
+        return payload
 
     try:
         payload = jwt.decode(
@@ -20,10 +48,71 @@ def get_jwt_payload(request: Request):
             audience=settings.AUTH_TOKEN_AUDIENCE,
             leeway=settings.AUTH_TOKEN_LEEWAY,
         )
-        return payload
 
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail='Token has expired')
 
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail='Invalid token')
+
+    if 'exp' in payload:
+        ttl = payload['exp'] + settings.AUTH_TOKEN_LEEWAY - time.time()
+        if ttl > 0:
+            token_cache.set(token_hash, payload, 1, ttl=ttl)
+    return payload
+
+
+def get_jwt_payload(request: Request):
+    """
+    Extract and verify JWT token from the cookie.
+    """
+    token = request.cookies.get('auth')
+    if not token:
+        raise HTTPException(status_code=401, detail='Missing authentication token')
+    return verify_token(token)
+
+
+async def is_token_revoked(token: str) -> bool:
+    token_hash = _token_hash(token)
+    revoked = revocation_cache.get(token_hash)
+    if revoked is None:
+        try:
+            revoked = bool(await get_redis().exists(_revocation_key(token_hash)))
+        except RedisError as e:
+            logger.warning(f'Failed to check token revocation: {e}')
+            return False
+        revocation_cache.set(token_hash, revoked, 1)
+    return revoked
+
+
+async def authenticate(token: str) -> dict:
+    """
+    Verify a JWT token and make sure it has not been revoked.
+    """
+    payload = verify_token(token)
+    if await is_token_revoked(token):
+        raise HTTPException(status_code=401, detail='Token has been revoked')
+    return payload
+
+
+async def revoke_token(token: str) -> None:
+    """
+    Add a token to the deny-list until it expires. Other workers notice the revocation
+    within AUTH_REVOCATION_CHECK_INTERVAL seconds.
+    """
+    token_hash = _token_hash(token)
+    token_cache.delete(token_hash)
+    revocation_cache.set(token_hash, True, 1)
+
+    try:
+        payload = jwt.decode(token, options={'verify_signature': False})
+        ttl = int(payload['exp'] - time.time()) + 1
+    except (jwt.InvalidTokenError, KeyError, TypeError):
+        ttl = 60 * 60 * 24
+    if ttl <= 0:
+        return
+
+    try:
+        await get_redis().set(_revocation_key(token_hash), 1, ex=ttl)
+    except RedisError as e:
+        logger.error(f'Failed to revoke token: {e}')
@@ -0,0 +1,68 @@
+import logging
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Decrement the estimate only if the user has one; a missing entry means "ask the data-service".
+CONSUME_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return redis.call('decrby', KEYS[1], ARGV[1])
+end
+return nil
+"""
+
+
+class QuotaLedger:
+    """
+    Per-user estimate of the remaining token quota, shared between workers through Redis.
+
+    The estimate is seeded from the data-service quota endpoint and decremented whenever
+    tokens are consumed. It expires after `ttl` seconds, and callers re-sync it once the
+    estimate falls to `margin` tokens or below.
+    """
+
+    def __init__(
+        self, ttl: int = settings.QUOTA_LEDGER_TTL, margin: int = settings.QUOTA_LEDGER_MARGIN
+    ):
+        self.ttl = ttl
+        self.margin = margin
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f'quota:{user_id}'
+
+    async def has_headroom(self, user_id: str) -> bool:
+        """Whether the local estimate is far enough from the limit to skip the data-service."""
+        try:
+            remaining = await get_redis().get(self._key(user_id))
+        except RedisError as e:
+            logger.warning(f'Failed to read quota ledger for {user_id}: {e}')
+            return False
+        return remaining is not None and int(remaining) > self.margin
+
+    async def seed(self, user_id: str, remaining_tokens: int) -> None:
+        try:
+            await get_redis().set(self._key(user_id), remaining_tokens, ex=self.ttl)
+        except RedisError as e:
+            logger.warning(f'Failed to seed quota ledger for {user_id}: {e}')
+
+    async def consume(self, user_id: str, tokens: int) -> None:
+        if not tokens:
+            return
+        try:
+            await get_redis().eval(CONSUME_SCRIPT, 1, self._key(user_id), tokens)
+        except RedisError as e:
+            logger.warning(f'Failed to update quota ledger for {user_id}: {e}')
+
+    async def invalidate(self, user_id: str) -> None:
+        try:
+            await get_redis().delete(self._key(user_id))
+        except RedisError as e:
+            logger.warning(f'Failed to invalidate quota ledger for {user_id}: {e}')
+
+
+quota_ledger = QuotaLedger()
@@ -1,15 +1,20 @@
 import httpx
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 
+from app.auth.auth import revoke_token
 from app.auth.schemas import LoginRequest
-from app.core.config import settings
+from app.core.http import get_dataservice_client
 
 router = APIRouter(prefix='/auth', tags=['auth'])
 
 
 @router.post('/login')
-async def login(request: LoginRequest, response: Response):
+async def login(
+    request: LoginRequest,
+    response: Response,
+    client: httpx.AsyncClient = Depends(get_dataservice_client),
+):
     """
     Login endpoint to authenticate a user and set the JWT cookie.
     """
@@ -19,33 +24,35 @@ async def login(request: LoginRequest, response: Response):
         'password': request.password,
     }
 
-    async with httpx.AsyncClient() as client:
-        auth_response = await client.post(
-            f'{settings.DATASERVICE_URL}/auth/jwt/login',
-            data=form_data,
-        )
+    auth_response = await client.post('/auth/jwt/login', data=form_data)
 
-        if auth_response.status_code != 204:
-            return JSONResponse(
-                status_code=auth_response.status_code, content={'detail': 'Invalid credentials'}
-            )
+    if auth_response.status_code != 204:
+        return JSONResponse(
+            status_code=auth_response.status_code, content={'detail': 'Invalid credentials'}
+        )
 
-        # Extract token from the response
-        token = auth_response.cookies.get('auth')
-        if not token:
-            raise HTTPException(status_code=500, detail='Authentication failed')
+    # Extract token from the response
+    token = auth_response.cookies.get('auth')
+    if not token:
+        raise HTTPException(status_code=500, detail='Authentication failed')
 
-        # Set the JWT token as a secure cookie
-        response.set_cookie(key='auth', value=token, httponly=True, secure=True)
-        return {'message': 'Login successful'}
+    # Set the JWT token as a secure cookie
+    response.set_cookie(key='auth', value=token, httponly=True, secure=True)
+    return {'message': 'Login successful'}
 
 
 @router.post('/logout')
-async def logout(response: Response):
+async def logout(
+    request: Request,
+    response: Response,
+    client: httpx.AsyncClient = Depends(get_dataservice_client),
+):
     """
-    Logout endpoint to remove the JWT cookie.
+    Logout endpoint to remove the JWT cookie and revoke the token.
     """
-    async with httpx.AsyncClient() as client:
-        await client.post(f'{settings.DATASERVICE_URL}/auth/jwt/logout')
+    await client.post('/auth/jwt/logout')
+    token = request.cookies.get('auth')
+    if token:
+        await revoke_token(token)
     response.delete_cookie('auth')
     return {'message': 'Logout successful'}
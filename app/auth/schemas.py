@@ -16,7 +16,7 @@ class ConsumedTokensInfo(BaseModel):
     model_name: str
 
 
-class TokenQuotaResponse:
+class TokenQuotaResponse(BaseModel):
     sufficient: bool
     token_limit: int
     consumed_tokens: int
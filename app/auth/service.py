@@ -3,47 +3,79 @@ import logging
 import httpx
 from fastapi import HTTPException, Request
 
-from app.auth.schemas import ConsumedTokensInfo
+from app.auth.quota import quota_ledger
+from app.auth.schemas import ConsumedTokensInfo, TokenQuotaResponse
+from app.auth.usage import usage_reporter
 from app.core.config import settings
+from app.core.http import get_dataservice_client
+from app.core.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 
 class AuthService:
-    def __init__(self, request: Request):
+    def __init__(self, request: Request, client: httpx.AsyncClient | None = None):
         self.request = request
         self.auth_token = self.request.state.token
         self.user_id = self.request.state.user_id
+        self.client = client or get_dataservice_client()
 
     async def check_token_quota(self) -> bool:
         """
-        Check the user's token quota via the data-service.
+        Check the user's token quota, asking the data-service only if the local ledger
+        has no estimate or the estimate is close to the limit.
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f'{settings.DATASERVICE_URL}/users/token/quota/',
-                headers={'Cookie': f'auth={self.auth_token}'},
-            )
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            return response.json()['sufficient']
+        if settings.QUOTA_LEDGER_ENABLED and await quota_ledger.has_headroom(self.user_id):
+            return True
+
+        quota = await self.fetch_token_quota()
+        if settings.QUOTA_LEDGER_ENABLED:
+            await quota_ledger.seed(self.user_id, quota.remaining_tokens)
+        return quota.sufficient
+
+    async def fetch_token_quota(self) -> TokenQuotaResponse:
+        """
+        Fetch the user's token quota from the data-service.
+        """
+        response = await self.client.get(
+            '/users/token/quota/',
+            headers={'Cookie': f'auth={self.auth_token}'},
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        return TokenQuotaResponse(**response.json())
 
     async def consume_tokens(self, result) -> None:
         """
-        Update the user's token consumption via the data-service.
+        Update the user's token consumption via the data-service. With write-behind
+        enabled the usage is queued and sent in batches by the `usage_reporter`.
         """
+        if result.tokens_info and result.tokens_info.get('cache_hit'):
+            self.report_cache_hit(result)
+            return
+
         payload: dict = ConsumedTokensInfo(**result.tokens_info).model_dump()
         result.tokens_info = None
 
         logger.info(f'Consuming {payload["consumed_tokens"]} tokens for {self.user_id}')
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f'{settings.DATASERVICE_URL}/users/token/',
-                json=payload,
-                headers={'Cookie': f'auth={self.auth_token}'},
-            )
-
-            if response.status_code != 201:
-                logger.error(f'Failed to consume tokens for {self.user_id}')
-            else:
-                logger.info(f'Tokens consumed for {self.user_id}')
+        if settings.QUOTA_LEDGER_ENABLED:
+            await quota_ledger.consume(self.user_id, payload['consumed_tokens'])
+
+        if settings.USAGE_WRITE_BEHIND_ENABLED:
+            await usage_reporter.record(self.auth_token, self.user_id, payload)
+        else:
+            await usage_reporter.send(self.auth_token, self.user_id, payload)
+
+    def report_cache_hit(self, result) -> None:
+        """
+        Record a result served without an LLM call. It is not billed, but counted separately.
+        """
+        tokens_info = result.tokens_info or {}
+        result.tokens_info = None
+
+        prompt_name = tokens_info.get('prompt_name', 'unknown')
+        saved_tokens = tokens_info.get('saved_tokens', 0)
+        metrics.increment('usage.cache_hits')
+        metrics.increment(f'usage.cache_hits.{prompt_name}')
+        metrics.increment('usage.saved_tokens', saved_tokens)
+        logger.info(f'Cache hit for {self.user_id} on {prompt_name}, saved {saved_tokens} tokens')
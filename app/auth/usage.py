@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import defaultdict
+
+from redis.exceptions import RedisError
+
+from app.auth.schemas import ConsumedTokensInfo
+from app.core.config import settings
+from app.core.http import get_dataservice_client
+from app.core.metrics import metrics
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Move the first ARGV[1] entries (all if 0) of the list KEYS[1] to the end of KEYS[2].
+MOVE_SCRIPT = """
+local entries = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #entries > 0 then
+    redis.call('ltrim', KEYS[1], #entries, -1)
+    redis.call('rpush', KEYS[2], unpack(entries))
+end
+return entries
+"""
+
+
+class UsageReporter:
+    """
+    Write-behind queue for token consumption reports.
+
+    Usage is appended to a Redis list and sent to the data-service in periodic batches,
+    aggregated per user, prompt and model. Queued entries hold no credentials; batches are
+    posted to the data-service's service endpoint with `DATASERVICE_API_KEY`, as the users'
+    tokens may have expired by then. Each flush atomically moves a batch into the
+    reporter's own processing list and deletes it only after the batch was handled. The
+    processing list of a reporter whose lease expired, e.g. after a crash, is moved back
+    to the queue by the next flush of any worker, so entries are resent rather than lost.
+
+    Rate limited, failed and unauthorized reports are retried up to `max_attempts` times.
+    Reports the data-service keeps rejecting are moved to a dead-letter list.
+    """
+
+    user_endpoint = '/users/token/'
+    service_endpoint = '/service/users/token/'
+
+    queue_key = 'usage:queue'
+    dead_letter_key = 'usage:dead'
+    flushers_key = 'usage:flushers'
+
+    def __init__(
+        self,
+        interval: float = settings.USAGE_FLUSH_INTERVAL,
+        batch_size: int = settings.USAGE_FLUSH_BATCH_SIZE,
+        max_attempts: int = settings.USAGE_MAX_ATTEMPTS,
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.lease = max(int(interval * 6), 30)
+        self.flusher_id = uuid.uuid4().hex
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def _processing_key(flusher_id: str) -> str:
+        return f'usage:processing:{flusher_id}'
+
+    @staticmethod
+    def _lease_key(flusher_id: str) -> str:
+        return f'usage:lease:{flusher_id}'
+
+    async def send(self, auth_token: str | None, user_id: str, payload: dict) -> int | None:
+        """
+        Post consumed tokens to the data-service right away, with the user's token or, if
+        None, to the service endpoint with the service credential. Returns the status code,
+        None if there is no credential to send them with.
+        """
+        client = get_dataservice_client()
+        if auth_token is not None:
+            response = await client.post(
+                self.user_endpoint, json=payload, headers={'Cookie': f'auth={auth_token}'}
+            )
+        elif settings.DATASERVICE_API_KEY:
+            response = await client.post(
+                self.service_endpoint,
+                json={'user_id': user_id, **payload},
+                headers={'Authorization': f'Bearer {settings.DATASERVICE_API_KEY}'},
+            )
+        else:
+            logger.error(f'Cannot report tokens for {user_id}: DATASERVICE_API_KEY is not set')
+            return None
+
+        if response.status_code == 201:
+            logger.info(f'Tokens consumed for {user_id}')
+        else:
+            logger.error(f'Failed to consume tokens for {user_id}: {response.status_code}')
+        return response.status_code
+
+    @staticmethod
+    def is_retryable(status_code: int | None) -> bool:
+        """Whether a report may succeed later; None stands for a request which failed."""
+        return status_code is None or status_code in (401, 403, 429) or status_code >= 500
+
+    async def record(self, auth_token: str | None, user_id: str, payload: dict) -> None:
+        """Queue consumed tokens, falling back to a direct post if Redis is unavailable."""
+        entry = json.dumps({'user_id': user_id, **payload})
+        try:
+            await get_redis().rpush(self.queue_key, entry)
+        except RedisError as e:
+            logger.warning(f'Failed to queue token usage for {user_id}, sending directly: {e}')
+            await self.send(auth_token, user_id, payload)
+
+    async def renew_lease(self, redis) -> None:
+        await redis.set(self._lease_key(self.flusher_id), 1, ex=self.lease)
+
+    async def recover(self, redis) -> int:
+        """
+        Move entries left in the processing lists of this reporter and of reporters whose
+        lease expired back to the queue. Returns the number of recovered entries.
+        """
+        recovered = 0
+        for flusher_id in await redis.smembers(self.flushers_key):
+            if flusher_id != self.flusher_id and await redis.exists(self._lease_key(flusher_id)):
+                continue
+            entries = await redis.eval(
+                MOVE_SCRIPT, 2, self._processing_key(flusher_id), self.queue_key, 0
+            )
+            recovered += len(entries)
+            if flusher_id != self.flusher_id:
+                await redis.srem(self.flushers_key, flusher_id)
+        if recovered:
+            logger.warning(f'Recovered {recovered} unacknowledged token usage entries')
+        return recovered
+
+    async def flush(self) -> int:
+        """Send one batch of queued usage. Returns the number of handled entries."""
+        redis = get_redis()
+        processing_key = self._processing_key(self.flusher_id)
+        await self.renew_lease(redis)
+        await redis.sadd(self.flushers_key, self.flusher_id)
+        await self.recover(redis)
+
+        entries = await redis.eval(MOVE_SCRIPT, 2, self.queue_key, processing_key, self.batch_size)
+        if not entries:
+            return 0
+
+        groups: dict[tuple[str, str, str], list[dict]] = defaultdict(list)
+        for entry in entries:
+            record = json.loads(entry)
+            key = (record['user_id'], record['prompt_name'], record['model_name'])
+            groups[key].append(record)
+
+        retry, dead = [], []
+        for (user_id, prompt_name, model_name), records in groups.items():
+            payload = ConsumedTokensInfo(
+                consumed_tokens=sum(r['consumed_tokens'] for r in records),
+                total_cost=sum(r['total_cost'] for r in records),
+                prompt_name=prompt_name,
+                model_name=model_name,
+            ).model_dump()
+            # Keep the lease while sending, so no other worker recovers this batch.
+            await self.renew_lease(redis)
+            try:
+                status_code = await self.send(None, user_id, payload)
+            except Exception as e:
+                logger.error(f'Failed to send token usage for {user_id}: {e}')
+                status_code = None
+            if status_code == 201:
+                continue
+
+            for record in records:
+                record['attempts'] = record.get('attempts', 0) + 1
+                record['status_code'] = status_code
+                if self.is_retryable(status_code) and record['attempts'] < self.max_attempts:
+                    retry.append(record)
+                else:
+                    dead.append(record)
+
+        if dead:
+            logger.error(
+                f'Moved {len(dead)} undeliverable token usage entries to the dead letters'
+            )
+            metrics.increment('usage.dead_lettered', len(dead))
+
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(processing_key)
+            if retry:
+                # Requeue at the end, the next flush retries them.
+                pipe.rpush(self.queue_key, *(json.dumps(r) for r in retry))
+            if dead:
+                pipe.rpush(self.dead_letter_key, *(json.dumps(r) for r in dead))
+            await pipe.execute()
+        return len(entries)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f'Failed to flush token usage: {e}')
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic flush and send whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        try:
+            for _ in range(settings.USAGE_FINAL_FLUSH_BATCHES):
+                if not await self.flush():
+                    break
+        except Exception as e:
+            logger.error(f'Final flush of token usage failed: {e}')
+            return
+
+        try:
+            redis = get_redis()
+            await redis.srem(self.flushers_key, self.flusher_id)
+            await redis.delete(self._lease_key(self.flusher_id))
+        except RedisError as e:
+            logger.warning(f'Failed to release the token usage lease: {e}')
+
+
+usage_reporter = UsageReporter()
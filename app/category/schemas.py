@@ -1,3 +1,5 @@
+from typing import ClassVar
+
 from pydantic import BaseModel, Field
 
 from app.project.schemas import BaseProjectRequest
@@ -26,6 +28,9 @@ class CreateCategoriesRequest(BaseProjectRequest):
 
 
 class AddCategoriesRequest(BaseProjectRequest):
+    cache_order_insensitive: ClassVar[set[str]] = {'existing'}
+    cache_case_insensitive: ClassVar[set[str]] = {'type'}
+
     existing: list[Category] = Field(
         ..., description='Existing categories which must be excluded from the identification.'
     )
@@ -1,6 +1,7 @@
 from app.category.schemas import (AddCategoriesRequest, CategoriesResponse,
                                   CreateCategoriesRequest)
 from app.core.ai_service import AIService
+from app.core.config import settings
 
 
 class CreateRiskCategoriesService(AIService):
@@ -8,6 +9,7 @@ class CreateRiskCategoriesService(AIService):
     route_path = '/categories/risk/create/'
     QueryModel = CreateCategoriesRequest
     ResultModel = CategoriesResponse
+    deadline = settings.LLM_LONG_DEADLINE
 
 
 class CreateOpportunitiesCategoriesService(AIService):
@@ -15,6 +17,7 @@ class CreateOpportunitiesCategoriesService(AIService):
     route_path = '/categories/opportunities/create/'
     QueryModel = CreateCategoriesRequest
     ResultModel = CategoriesResponse
+    deadline = settings.LLM_LONG_DEADLINE
 
 
 class AddRiskCategoriesService(AIService):
@@ -22,6 +25,7 @@ class AddRiskCategoriesService(AIService):
     route_path = '/categories/risk/add/'
     QueryModel = AddCategoriesRequest
     ResultModel = CategoriesResponse
+    deadline = settings.LLM_LONG_DEADLINE
 
 
 class AddOpportunitiesCategoriesService(AIService):
@@ -29,3 +33,4 @@ class AddOpportunitiesCategoriesService(AIService):
     route_path = '/categories/opportunities/add/'
     QueryModel = AddCategoriesRequest
     ResultModel = CategoriesResponse
+    deadline = settings.LLM_LONG_DEADLINE
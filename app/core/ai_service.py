@@ -1,31 +1,130 @@
+import asyncio
 import hashlib
 import json
+import logging
+import time
 from abc import ABC
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from functools import lru_cache
 
-from langchain import hub
-from langchain_community.callbacks import get_openai_callback
-from langchain_core.output_parsers import PydanticOutputParser
+from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import (JsonOutputParser,
+                                           PydanticOutputParser,
+                                           StrOutputParser)
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 from app.core.config import settings
-from app.utils.cache import redis_cache
+from app.core.http import get_llm_async_client, get_llm_client
+from app.core.metrics import metrics
+from app.core.model_routing import ModelRoute, resolve_route
+from app.core.prompt_registry import prompt_registry
+from app.core.rate_limit import rate_limiter
+from app.core.resilience import LatencyTracker, hedged, with_retries
+from app.utils.cache import (get_cached_result, redis_cache,
+                             store_cached_result)
+from app.utils.canonical import canonicalize
+from app.utils.schema import output_model, strict_json_schema
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=256)
+def compile_prompt(template: str, format_instructions: str) -> ChatPromptTemplate:
+    """Build the chat prompt once per template version and format instructions."""
+    format_instructions = format_instructions.replace('{', '{{').replace('}', '}}')
+    if format_instructions:
+        template += '\nPlease output the result as a JSON object that conforms to the schema above and do not include any additional text.'
+
+    return ChatPromptTemplate.from_template(
+        template=template,
+        partial_variables={'format_instructions': format_instructions},
+    )
 
 
 class BaseAIService(ABC):
     model_name: str = settings.OPENAI_MODEL_NAME
     temperature: float = settings.OPENAI_TEMPERATURE
 
+    # Primary and fallback models; None calls `model_name` only. Overridden per service
+    # class by `MODEL_ROUTES`. The primary model is part of the cache key.
+    model_route: ModelRoute | None = None
+
+    # Cached results expire after `cache_timeout` seconds (None: the cache's default). Results
+    # older than `cache_soft_timeout` are still served but refreshed in the background.
+    cache_timeout: int | None = None
+    cache_soft_timeout: int | None = None
+
+    # Query fields compared by text similarity if SIMILARITY_CACHE_ENABLED is set; all other
+    # fields must match exactly. Only opt in where a near match has the same answer, and keep
+    # long shared fields such as the project context out, as they drown out the difference.
+    # `similarity_threshold` overrides the global threshold.
+    similarity_fields: tuple[str, ...] = ()
+    similarity_threshold: float | None = None
+
+    # Also register a route streaming the partially parsed result while tokens arrive.
+    streaming: bool = False
+
+    # Let the provider enforce the JSON schema of the result (OpenAI's strict json_schema
+    # mode) instead of describing it in the prompt and parsing free text. Every model of the
+    # service's route must support it.
+    structured_output: bool = settings.LLM_STRUCTURED_OUTPUT
+
+    # `deadline` bounds all attempts of a query, across all models of its route (None: no
+    # limit); a route escalating on timeouts splits it between the models. Services generating
+    # long lists use `LLM_LONG_DEADLINE`; jobs run with `use_deadline=False` and are bounded
+    # by `JOB_TIMEOUT` only. Transient errors are retried `max_retries` times. With
+    # `hedge_percentile` set, a second identical call is started once the first is slower
+    # than that percentile of recent calls.
+    deadline: float | None = settings.LLM_DEADLINE
+    max_retries: int = settings.LLM_MAX_RETRIES
+    hedge_percentile: float | None = settings.LLM_HEDGE_PERCENTILE
+
     prompt_name: str
     QueryModel = BaseModel
     ResultModel = BaseModel
 
     def __init__(self) -> None:
-        self.model = ChatOpenAI(
-            model=self.model_name, api_key=settings.OPENAI_API_KEY, temperature=self.temperature
+        self.route = resolve_route(
+            type(self).__name__, self.model_route or ModelRoute(primary=self.model_name)
         )
-        self.parser = PydanticOutputParser(pydantic_object=self.ResultModel)
+        self.model_name = self.route.primary
+        self.models: dict[str, ChatOpenAI] = {}
+        self.model = self.get_model(self.model_name)
+        # The model only produces the output fields; `tokens_info` and `routing` are set by
+        # the service, so they are kept out of the format instructions and the schema.
+        self.OutputModel = output_model(self.ResultModel)
+        self.parser = PydanticOutputParser(pydantic_object=self.OutputModel)
+        if self.structured_output:
+            self.response_format = {
+                'type': 'json_schema',
+                'json_schema': {
+                    'name': self.ResultModel.__name__,
+                    'schema': strict_json_schema(self.OutputModel),
+                    'strict': True,
+                },
+            }
+            self.format_instructions = ''
+        else:
+            self.format_instructions = self.parser.get_format_instructions()
+        self.latency: dict[str, LatencyTracker] = defaultdict(LatencyTracker)
+
+    def get_model(self, model_name: str) -> ChatOpenAI:
+        model = self.models.get(model_name)
+        if model is None:
+            model = self.models[model_name] = ChatOpenAI(
+                model=model_name,
+                api_key=settings.OPENAI_API_KEY,
+                temperature=self.temperature,
+                http_client=get_llm_client(),
+                http_async_client=get_llm_async_client(),
+                stream_usage=True,
+                max_retries=0,  # retried by `run_query`
+            )
+        return model
 
     def generate_cache_key(self, query: QueryModel, *args, **kwargs) -> str:
         """Generate a consistent cache key based on query content and service parameters."""
@@ -33,7 +132,7 @@ class BaseAIService(ABC):
             'model_name': self.model_name,
             'prompt_name': self.get_prompt_name(query),
             'temperature': self.temperature,
-            'query': query.model_dump(),
+            'query': canonicalize(query),
         }
 
         # Create a consistent string representation
@@ -41,33 +140,228 @@ class BaseAIService(ABC):
         return f'{self.__class__.__name__}:{hashlib.md5(key_str.encode()).hexdigest()}'
 
     def create_prompt(self, query: QueryModel) -> ChatPromptTemplate:
-        template = hub.pull(self.get_prompt_name(query)).template
-        format_instructions = self.parser.get_format_instructions()
-        format_instructions = format_instructions.replace('{', '{{').replace('}', '}}')
-        template += '\nPlease output the result as a JSON object that conforms to the schema above and do not include any additional text.'
+        template = prompt_registry.get_template(self.get_prompt_name(query))
+        return compile_prompt(template, self.format_instructions)
 
-        return ChatPromptTemplate.from_template(
-            template=template,
-            partial_variables={'format_instructions': format_instructions},
+    async def acreate_prompt(self, query: QueryModel) -> ChatPromptTemplate:
+        template = await prompt_registry.aget_template(self.get_prompt_name(query))
+        return compile_prompt(template, self.format_instructions)
+
+    def get_chain(self, prompt: ChatPromptTemplate, model_name: str):
+        """The chain from `prompt` to the parsed result, using `model_name`."""
+        model = self.get_model(model_name)
+        if not self.structured_output:
+            return prompt | model | self.parser | self.to_result
+        return (
+            prompt
+            | model.bind(response_format=self.response_format)
+            | StrOutputParser()
+            | self.parse_output
         )
 
+    def parse_output(self, text: str) -> ResultModel:
+        """Validate a structured-output completion into the result model."""
+        try:
+            output = self.OutputModel.model_validate_json(text)
+        except ValidationError as e:
+            raise OutputParserException(
+                f'Invalid {self.ResultModel.__name__}: {e}', llm_output=text
+            ) from e
+        return self.to_result(output)
+
+    def to_result(self, output: BaseModel) -> ResultModel:
+        """The result model for the fields produced by the LLM, before the service sets its own."""
+        return self.ResultModel.model_validate({**dict(output), 'tokens_info': None})
+
     def get_prompt_name(self, query: QueryModel) -> str:
         return self.prompt_name
 
+    async def get_cached_result(self, query: QueryModel) -> ResultModel | None:
+        """Return the cached result for `query`, or None without calling the LLM."""
+        return await get_cached_result(self, query, refresh=lambda: self.run_query(query))
+
     @redis_cache()
-    async def execute_query(self, query: QueryModel) -> ResultModel:
-        prompt = self.create_prompt(query)
-        chain = prompt | self.model | self.parser
-        with get_openai_callback() as cb:
-            result = chain.invoke(query.model_dump())
-            result.tokens_info = {
-                'consumed_tokens': cb.total_tokens,
-                'total_cost': cb.total_cost,
-                'prompt_name': self.prompt_name,
-                'model_name': self.model_name,
-            }
+    async def execute_query(self, query: QueryModel, use_deadline: bool = True) -> ResultModel:
+        return await self.run_query(query, use_deadline=use_deadline)
+
+    async def run_query(self, query: QueryModel, use_deadline: bool = True) -> ResultModel:
+        """
+        Run the chain for `query`, bypassing the cache, escalating along the model route.
+        Without `use_deadline`, the caller bounds the call instead of the service's deadline.
+        """
+        prompt = await self.acreate_prompt(query)
+        inputs = query.model_dump()
+        prompt_tokens = self.estimate_prompt_tokens(prompt, inputs)
+
+        models, reason = self.route.candidates(prompt_tokens)
+        escalations = []
+        if reason is not None:
+            metrics.increment(f'llm.escalated.{reason}')
+            escalations.append({'model': self.route.primary, 'reason': reason})
+
+        # A handler per call keeps token counts separate between concurrent requests.
+        usages: list[OpenAICallbackHandler] = []
+        interrupted: list[int] = []
+        deadline = None
+        if use_deadline and self.deadline is not None:
+            deadline = time.monotonic() + self.deadline
+        for i, model_name in enumerate(models):
+            timeout = self.get_timeout(deadline, len(models) - i)
+            try:
+                result = await self.run_model(
+                    model_name, prompt, inputs, prompt_tokens, usages, interrupted, timeout
+                )
+                break
+            except Exception as e:
+                reason = self.route.escalation_reason(e)
+                if reason is None or i == len(models) - 1:
+                    raise
+                logger.warning(f'{type(self).__name__} escalates from {model_name}: {reason}')
+                metrics.increment(f'llm.escalated.{reason}')
+                escalations.append({'model': model_name, 'reason': reason})
+
+        result.tokens_info = self.get_tokens_info(
+            *usages, model_name=model_name, interrupted_tokens=sum(interrupted)
+        )
+        result.routing = {
+            'model': model_name,
+            'primary': self.route.primary,
+            'escalations': escalations,
+        }
         return result
 
+    async def run_model(
+        self,
+        model_name: str,
+        prompt: ChatPromptTemplate,
+        inputs: dict,
+        prompt_tokens: int,
+        usages: list[OpenAICallbackHandler],
+        interrupted: list[int],
+        timeout: float | None = None,
+    ):
+        """
+        Call one model within `timeout` seconds, with retries and hedging. The usage of every
+        call is appended to `usages`; calls cancelled before they reported their usage add
+        their prompt tokens to `interrupted`.
+        """
+        chain = self.get_chain(prompt, model_name)
+
+        async def attempt():
+            usage = OpenAICallbackHandler()
+            usages.append(usage)
+            estimate = await self.acquire_rate_limit(prompt_tokens, model_name)
+            start = time.monotonic()
+            try:
+                result = await chain.ainvoke(inputs, config={'callbacks': [usage]})
+            except asyncio.CancelledError:
+                # A hedged call that lost still costs at least its prompt tokens.
+                if not usage.total_tokens:
+                    interrupted.append(prompt_tokens)
+                raise
+            finally:
+                if estimate:
+                    await rate_limiter.release(model_name, estimate - usage.total_tokens)
+            self.latency[model_name].record(time.monotonic() - start)
+            return result
+
+        name = type(self).__name__
+
+        def call():
+            return hedged(attempt, self.get_hedge_delay(model_name), name)
+
+        try:
+            if timeout is not None and timeout <= 0:
+                raise TimeoutError
+            return await asyncio.wait_for(with_retries(call, self.max_retries, name), timeout)
+        except TimeoutError:
+            metrics.increment('llm.deadline_exceeded')
+            metrics.increment(f'llm.deadline_exceeded.{name}')
+            raise
+
+    async def stream_query(self, query: QueryModel) -> AsyncIterator[dict | ResultModel]:
+        """
+        Run the chain for `query` and yield the partially parsed JSON object whenever new
+        tokens arrive. The last item is the validated result, which is also cached.
+        """
+        prompt = await self.acreate_prompt(query)
+        model = self.model
+        if self.structured_output:
+            model = model.bind(response_format=self.response_format)
+        chain = prompt | model | JsonOutputParser(pydantic_object=self.OutputModel)
+        inputs = query.model_dump()
+        estimate = await self.acquire_rate_limit(
+            self.estimate_prompt_tokens(prompt, inputs), self.model_name
+        )
+
+        usage = OpenAICallbackHandler()
+        partial = {}
+        try:
+            async for partial in chain.astream(inputs, config={'callbacks': [usage]}):
+                yield partial
+        finally:
+            if estimate:
+                await rate_limiter.release(self.model_name, estimate - usage.total_tokens)
+
+        routing = {'model': self.model_name, 'primary': self.model_name, 'escalations': []}
+        result = self.ResultModel.model_validate(
+            {**partial, 'tokens_info': self.get_tokens_info(usage), 'routing': routing}
+        )
+        await store_cached_result(self, query, result)
+        yield result
+
+    def get_timeout(self, deadline: float | None, models_left: int) -> float | None:
+        """
+        Seconds left for the next model of the route until the monotonic `deadline`. If the
+        route escalates on timeouts, the remaining models share the time equally.
+        """
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if 'timeout' in self.route.escalate_on:
+            return remaining / models_left
+        return remaining
+
+    def get_hedge_delay(self, model_name: str) -> float | None:
+        """Seconds after which a call is hedged, None to not hedge (yet)."""
+        if self.hedge_percentile is None:
+            return None
+        delay = self.latency[model_name].percentile(self.hedge_percentile)
+        return None if delay is None else max(delay, settings.LLM_HEDGE_MIN_DELAY)
+
+    def estimate_prompt_tokens(self, prompt: ChatPromptTemplate, inputs: dict) -> int:
+        messages = prompt.format_messages(**inputs)
+        try:
+            return self.model.get_num_tokens_from_messages(messages)
+        except Exception:
+            # e.g. the tokenizer could not be loaded, assume ~4 characters per token
+            return sum(len(str(message.content)) for message in messages) // 4
+
+    async def acquire_rate_limit(self, prompt_tokens: int, model_name: str) -> int:
+        """Wait for capacity of the model, returns the estimated tokens of the call."""
+        if not settings.RATE_LIMIT_ENABLED:
+            return 0
+        estimate = prompt_tokens + settings.RATE_LIMIT_COMPLETION_TOKENS
+        await rate_limiter.acquire(model_name, estimate)
+        return estimate
+
+    def get_tokens_info(
+        self,
+        *usages: OpenAICallbackHandler,
+        model_name: str | None = None,
+        interrupted_tokens: int = 0,
+    ) -> dict:
+        """
+        Summed usage of all calls made for one result, including hedged, retried and
+        escalated ones. `model_name` is the model which produced the result.
+        """
+        return {
+            'consumed_tokens': sum(usage.total_tokens for usage in usages) + interrupted_tokens,
+            'total_cost': sum(usage.total_cost for usage in usages),
+            'prompt_name': self.prompt_name,
+            'model_name': model_name or self.model_name,
+        }
+
 
 class AIService(BaseAIService):
     prompt_name: str
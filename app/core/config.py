@@ -50,18 +50,90 @@ class Settings(BaseSettings):
 
     OPENAI_MODEL_NAME: str = 'gpt-4o-mini'
     OPENAI_TEMPERATURE: float = 0.7
+    LLM_STRUCTURED_OUTPUT: bool = False  # all routed models must support strict json_schema
+    # Model routes per service class name, overriding the declared ones, e.g.
+    # {"RiskDefinitionService": {"primary": "gpt-4o-mini", "fallbacks": ["gpt-4o"]}}
+    MODEL_ROUTES: dict[str, dict[str, Any]] = {}
+    OPENAI_TIMEOUT: float = 60.0  # in seconds
+    OPENAI_MAX_CONNECTIONS: int = 100
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    OPENAI_KEEPALIVE_EXPIRY: float = 60.0  # in seconds
+
+    LLM_DEADLINE: float | None = 45.0  # in seconds, for all attempts of a query
+    LLM_LONG_DEADLINE: float | None = 240.0  # in seconds, for services generating long lists
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BASE_DELAY: float = 0.5  # in seconds
+    LLM_RETRY_MAX_DELAY: float = 8.0  # in seconds
+    LLM_HEDGE_PERCENTILE: float | None = None  # e.g. 0.95; None disables hedging
+    LLM_HEDGE_MIN_DELAY: float = 2.0  # in seconds
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_LATENCY_WINDOW: int = 200
+
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_RPM: int = 500  # until learned from the response headers
+    RATE_LIMIT_TPM: int = 200_000  # until learned from the response headers
+    RATE_LIMIT_MAX_WAIT: float = 10.0  # in seconds
+    RATE_LIMIT_COMPLETION_TOKENS: int = 1000  # expected completion size per call
+
+    PROMPT_CACHE_TTL: int = 60 * 10  # in seconds
+    PROMPT_SNAPSHOT_DIR: Path | None = Path('.prompts')
 
     REDIS_URL: str = 'redis://localhost:6379/0'
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_SOCKET_TIMEOUT: float = 0.5  # in seconds
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 1.0  # in seconds
     CACHE_TIMEOUT: int = 60 * 60 * 24
+    CACHE_STALE_TIMEOUT: int = 60 * 60 * 24 * 30  # for entries revalidated in the background
+    CACHE_L1_ENABLED: bool = True
+    CACHE_L1_TIMEOUT: int = 60 * 5
+    CACHE_L1_MAX_ENTRIES: int = 1024
+    CACHE_L1_MAX_BYTES: int = 32 * 1024 * 1024
+    CACHE_LOCK_ENABLED: bool = False
+    CACHE_LOCK_TIMEOUT: int = 60  # in seconds
+    CACHE_LOCK_POLL_INTERVAL: float = 0.25  # in seconds
+    SIMILARITY_CACHE_ENABLED: bool = False
+    SIMILARITY_CACHE_THRESHOLD: float = 0.92
+    SIMILARITY_CACHE_MAX_ENTRIES: int = 512
+    BATCH_MAX_CONCURRENCY: int = 8  # parallel LLM calls per batch request
+    BATCH_MAX_RISKS: int = 50  # risks per batch request
+    PIPELINE_MAX_CATEGORIES: int = 10  # categories searched for risks per risk register
+    PIPELINE_MAX_RISKS: int = 50  # risks assessed per risk register
 
     DATASERVICE_URL: AnyUrl
+    DATASERVICE_API_KEY: str | None = None  # service credential, to report deferred usage
+    DATASERVICE_TIMEOUT: float = 10.0  # in seconds
+    DATASERVICE_RETRIES: int = 2  # retries on connection errors
+    DATASERVICE_HTTP2: bool = False  # requires httpx[http2]
+    DATASERVICE_MAX_CONNECTIONS: int = 100
+    DATASERVICE_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    DATASERVICE_KEEPALIVE_EXPIRY: float = 30.0  # in seconds
     SENTRY_DSN: str
+
+    QUOTA_LEDGER_ENABLED: bool = True
+    QUOTA_LEDGER_TTL: int = 60 * 5  # in seconds
+    QUOTA_LEDGER_MARGIN: int = 20_000  # re-sync below this many remaining tokens
+
+    USAGE_WRITE_BEHIND_ENABLED: bool = True
+    USAGE_FLUSH_INTERVAL: float = 5.0  # in seconds
+    USAGE_FLUSH_BATCH_SIZE: int = 500
+    USAGE_FINAL_FLUSH_BATCHES: int = 10
+    USAGE_MAX_ATTEMPTS: int = 10  # then reports are moved to the `usage:dead` list
+
+    JOB_IN_PROCESS_WORKER: bool = True  # otherwise run `manage.py worker`
+    JOB_CONCURRENCY: int = 4  # jobs run in parallel per worker process
+    JOB_QUEUE_MAX_SIZE: int = 1000
+    JOB_TIMEOUT: float = 60.0 * 5  # in seconds
+    JOB_TTL: int = 60 * 60  # in seconds, for queued jobs and results
+    JOB_POLL_INTERVAL: float = 0.5  # in seconds
+    JOB_MAX_WAIT: float = 30.0  # in seconds, for long-polling a job
     LOG_LEVEL: str = 'ERROR'
 
     SECRET_KEY: str
     AUTH_TOKEN_LEEWAY: int = -30  # in seconds
     AUTH_TOKEN_ALGORITHM: str = 'HS256'
     AUTH_TOKEN_AUDIENCE: str = 'fastapi-users:auth'
+    AUTH_TOKEN_CACHE_SIZE: int = 10_000
+    AUTH_REVOCATION_CHECK_INTERVAL: float = 5.0  # in seconds
 
     @classmethod
     def from_env(cls):
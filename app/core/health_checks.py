@@ -1,9 +1,10 @@
 import requests
 from fastapi import APIRouter, HTTPException
-from langchain import hub
 from langchain_openai import ChatOpenAI
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.prompt_registry import prompt_registry
 
 router = APIRouter(tags=['Health Check'])
 
@@ -13,11 +14,16 @@ async def health_check():
     return {'status': 'ok'}
 
 
+@router.get('/health-check/metrics')
+async def get_metrics():
+    return metrics.snapshot()
+
+
 @router.get('/health-check/openai/check-connection')
 async def check_openai_connection():
     llm = ChatOpenAI(model_name='gpt-3.5-turbo', api_key=settings.OPENAI_API_KEY)
     try:
-        response = llm.invoke(['Answer: yes'])
+        response = await llm.ainvoke(['Answer: yes'])
         if response:
             return {'message': 'OpenAI connection successful'}
         else:
@@ -30,8 +36,8 @@ async def check_openai_connection():
 async def check_smith_connection():
     llm = ChatOpenAI(model_name='gpt-3.5-turbo', api_key=settings.OPENAI_API_KEY)
     try:
-        prompt_template = hub.pull('health-check').template
-        response = llm.invoke([prompt_template])
+        prompt_template = await prompt_registry.aget_template('health-check')
+        response = await llm.ainvoke([prompt_template])
         if response:
             return {'message': 'Smith connection successful'}
         else:
@@ -0,0 +1,83 @@
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+
+import httpx
+
+from app.core.config import settings
+from app.core.rate_limit import rate_limiter
+
+_llm_client: httpx.Client | None = None
+_llm_async_client: httpx.AsyncClient | None = None
+_dataservice_client: httpx.AsyncClient | None = None
+
+
+def _llm_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_llm_client() -> httpx.Client:
+    """Return the keep-alive client shared by all synchronous LLM calls."""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = httpx.Client(limits=_llm_limits(), timeout=settings.OPENAI_TIMEOUT)
+    return _llm_client
+
+
+def get_llm_async_client() -> httpx.AsyncClient:
+    """Return the keep-alive client shared by all asynchronous LLM calls."""
+    global _llm_async_client
+    if _llm_async_client is None:
+        hooks = [rate_limiter.on_response] if settings.RATE_LIMIT_ENABLED else []
+        _llm_async_client = httpx.AsyncClient(
+            limits=_llm_limits(),
+            timeout=settings.OPENAI_TIMEOUT,
+            event_hooks={'response': hooks},
+        )
+    return _llm_async_client
+
+
+async def close_llm_clients() -> None:
+    global _llm_client, _llm_async_client
+    if _llm_client is not None:
+        _llm_client.close()
+        _llm_client = None
+    if _llm_async_client is not None:
+        await _llm_async_client.aclose()
+        _llm_async_client = None
+
+
+def get_dataservice_client() -> httpx.AsyncClient:
+    """
+    Return the keep-alive client for the data-service, usable as a FastAPI dependency.
+
+    The client is shared between users, so it never stores cookies; the auth cookie has
+    to be passed explicitly with every request.
+    """
+    global _dataservice_client
+    if _dataservice_client is None:
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=settings.DATASERVICE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.DATASERVICE_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.DATASERVICE_KEEPALIVE_EXPIRY,
+            ),
+            http2=settings.DATASERVICE_HTTP2,
+            retries=settings.DATASERVICE_RETRIES,
+        )
+        _dataservice_client = httpx.AsyncClient(
+            base_url=str(settings.DATASERVICE_URL),
+            transport=transport,
+            timeout=settings.DATASERVICE_TIMEOUT,
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        )
+    return _dataservice_client
+
+
+async def close_dataservice_client() -> None:
+    global _dataservice_client
+    if _dataservice_client is not None:
+        await _dataservice_client.aclose()
+        _dataservice_client = None
@@ -0,0 +1,23 @@
+from collections import Counter
+
+
+class Metrics:
+    """Process-local counters, e.g. cache hits per tier. Exposed via the health check router."""
+
+    def __init__(self):
+        self._counters: Counter[str] = Counter()
+
+    def increment(self, name: str, value: int = 1) -> None:
+        self._counters[name] += value
+
+    def get(self, name: str) -> int:
+        return self._counters[name]
+
+    def snapshot(self) -> dict[str, int]:
+        return dict(sorted(self._counters.items()))
+
+    def reset(self) -> None:
+        self._counters.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,59 @@
+from typing import Literal
+
+import openai
+from langchain_core.exceptions import OutputParserException
+from pydantic import BaseModel, Field, ValidationError
+
+from app.core.config import settings
+from app.core.rate_limit import RateLimitExceeded
+
+EscalationReason = Literal['input_size', 'parse_error', 'timeout', 'rate_limit']
+
+
+class ModelRoute(BaseModel):
+    """
+    Which models a service calls: the primary model first, then the fallbacks in order
+    whenever a call fails for one of the `escalate_on` reasons. Prompts estimated above
+    `max_input_tokens` skip the primary model.
+    """
+
+    primary: str = Field(..., description='The model tried first.')
+    fallbacks: list[str] = Field([], description='The models tried if the previous one failed.')
+    escalate_on: set[EscalationReason] = Field(
+        {'parse_error', 'timeout'}, description='The failures which move on to the next model.'
+    )
+    max_input_tokens: int | None = Field(
+        None, description='Larger prompts start with the first fallback.'
+    )
+
+    def candidates(self, prompt_tokens: int) -> tuple[list[str], EscalationReason | None]:
+        """The models to try for a prompt, and why the primary model is skipped, if it is."""
+        models = [self.primary, *self.fallbacks]
+        if (
+            self.max_input_tokens is not None
+            and prompt_tokens > self.max_input_tokens
+            and 'input_size' in self.escalate_on
+            and self.fallbacks
+        ):
+            return models[1:], 'input_size'
+        return models, None
+
+    def escalation_reason(self, error: Exception) -> EscalationReason | None:
+        """The reason to try the next model after `error`, None if it should be raised."""
+        if isinstance(error, (OutputParserException, ValidationError)):
+            reason = 'parse_error'
+        elif isinstance(error, TimeoutError):
+            reason = 'timeout'
+        elif isinstance(error, (RateLimitExceeded, openai.RateLimitError)):
+            reason = 'rate_limit'
+        else:
+            return None
+        return reason if reason in self.escalate_on else None
+
+
+def resolve_route(service_name: str, default: ModelRoute) -> ModelRoute:
+    """The route configured in `MODEL_ROUTES` for a service class, else its declared one."""
+    override = settings.MODEL_ROUTES.get(service_name)
+    if override is None:
+        return default
+    return ModelRoute.model_validate({**default.model_dump(), **override})
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+from langchain import hub
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Templates shipped with the code for prompts which are not (yet) published on the hub.
+BUNDLED_PROMPTS_DIR = Path(__file__).parents[1] / 'prompts'
+
+
+class PromptRegistry:
+    """
+    In-process registry for LangChain Hub prompt templates.
+
+    Every prompt is pulled once and then served from memory. Entries older than `ttl`
+    keep being served while a background thread pulls the latest version. Each
+    successful pull is written to a local snapshot which is used on cold starts and
+    whenever the hub cannot be reached. Prompts without a snapshot fall back to the
+    version bundled in `bundled_dir`, until the hub serves them.
+    """
+
+    def __init__(
+        self,
+        ttl: int = settings.PROMPT_CACHE_TTL,
+        snapshot_dir: Path | None = None,
+        bundled_dir: Path | None = None,
+    ):
+        self.ttl = ttl
+        self.snapshot_dir = snapshot_dir
+        self.bundled_dir = bundled_dir
+        self._templates: dict[str, tuple[str, float]] = {}
+        self._bundled: set[str] = set()
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+
+    def get_template(self, prompt_name: str) -> str:
+        """Return the template text for `prompt_name`, pulling it only if nothing is known."""
+        entry = self._templates.get(prompt_name)
+        if entry is None:
+            return self._load(prompt_name)
+
+        template, fetched_at = entry
+        if time.monotonic() - fetched_at > self.ttl:
+            self._schedule_refresh(prompt_name)
+        return template
+
+    async def aget_template(self, prompt_name: str) -> str:
+        """Like `get_template`, but runs a blocking first pull in a worker thread."""
+        if prompt_name in self._templates:
+            return self.get_template(prompt_name)
+        return await asyncio.to_thread(self.get_template, prompt_name)
+
+    def preload(self, prompt_names: list[str]) -> None:
+        """Fetch the given prompts in the background so first requests do not block."""
+        for prompt_name in prompt_names:
+            if prompt_name not in self._templates:
+                if self._read_bundled(prompt_name) is not None:
+                    self._load(prompt_name)
+                else:
+                    self._schedule_refresh(prompt_name)
+
+    def _load(self, prompt_name: str) -> str:
+        template = self._read_snapshot(prompt_name)
+        if template is None:
+            template = self._read_bundled(prompt_name)
+            if template is None:
+                return self._pull(prompt_name)
+            self._bundled.add(prompt_name)
+
+        # Serve the snapshot right away, but mark it as stale to get the latest version.
+        self._templates[prompt_name] = (template, float('-inf'))
+        self._schedule_refresh(prompt_name)
+        return template
+
+    def _pull(self, prompt_name: str) -> str:
+        template = hub.pull(prompt_name).template
+        self._templates[prompt_name] = (template, time.monotonic())
+        self._bundled.discard(prompt_name)
+        self._write_snapshot(prompt_name, template)
+        return template
+
+    def _schedule_refresh(self, prompt_name: str) -> None:
+        with self._lock:
+            if prompt_name in self._refreshing:
+                return
+            self._refreshing.add(prompt_name)
+
+        threading.Thread(target=self._refresh, args=(prompt_name,), daemon=True).start()
+
+    def _refresh(self, prompt_name: str) -> None:
+        try:
+            self._pull(prompt_name)
+            logger.debug(f'Prompt refreshed: {prompt_name}')
+        except Exception as e:
+            if prompt_name in self._bundled:
+                logger.info(f'Prompt {prompt_name} not pulled, serving the bundled version: {e}')
+            else:
+                logger.warning(f'Failed to refresh prompt {prompt_name}: {e}')
+            entry = self._templates.get(prompt_name)
+            if entry is not None:
+                # Keep serving the last good version and retry after another ttl.
+                self._templates[prompt_name] = (entry[0], time.monotonic())
+        finally:
+            with self._lock:
+                self._refreshing.discard(prompt_name)
+
+    def _snapshot_path(self, prompt_name: str) -> Path | None:
+        if self.snapshot_dir is None:
+            return None
+        return Path(self.snapshot_dir) / f"{prompt_name.replace('/', '__')}.json"
+
+    def _read_snapshot(self, prompt_name: str) -> str | None:
+        path = self._snapshot_path(prompt_name)
+        if path is None or not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text())['template']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f'Ignoring unreadable prompt snapshot {path}: {e}')
+            return None
+
+    def _read_bundled(self, prompt_name: str) -> str | None:
+        if self.bundled_dir is None:
+            return None
+        path = Path(self.bundled_dir) / f"{prompt_name.replace('/', '__')}.txt"
+        try:
+            return path.read_text()
+        except OSError:
+            return None
+
+    def _write_snapshot(self, prompt_name: str, template: str) -> None:
+        path = self._snapshot_path(prompt_name)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f'.{threading.get_ident()}.tmp')
+            tmp_path.write_text(json.dumps({'name': prompt_name, 'template': template}))
+            tmp_path.replace(path)
+        except OSError as e:
+            logger.warning(f'Failed to write prompt snapshot {path}: {e}')
+
+
+prompt_registry = PromptRegistry(
+    snapshot_dir=settings.PROMPT_SNAPSHOT_DIR, bundled_dir=BUNDLED_PROMPTS_DIR
+)
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import random
+import time
+
+import httpx
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Refill the request and token buckets of a model and take `cost` tokens and one request
+# if both suffice. Returns the seconds to wait until they would, 0 if acquired. Limits
+# learned from the response headers take precedence over the configured ones.
+ACQUIRE_SCRIPT = """
+local state = redis.call('hmget', KEYS[1], 'requests', 'tokens', 'ts', 'rpm', 'tpm')
+local rpm = tonumber(state[4]) or tonumber(ARGV[1])
+local tpm = tonumber(state[5]) or tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = math.min(tonumber(ARGV[4]), tpm)
+
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+local requests = math.min(rpm, (tonumber(state[1]) or rpm) + elapsed * rpm / 60)
+local tokens = math.min(tpm, (tonumber(state[2]) or tpm) + elapsed * tpm / 60)
+
+local wait = 0
+if requests < 1 then
+    wait = math.max(wait, (1 - requests) * 60 / rpm)
+end
+if tokens < cost then
+    wait = math.max(wait, (cost - tokens) * 60 / tpm)
+end
+if wait == 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+end
+
+redis.call('hset', KEYS[1], 'requests', requests, 'tokens', tokens, 'ts', now)
+redis.call('expire', KEYS[1], ARGV[5])
+return tostring(wait)
+"""
+
+# Store the limits reported by the provider and clamp the buckets to its remaining capacity.
+UPDATE_SCRIPT = """
+if ARGV[1] ~= '' then redis.call('hset', KEYS[1], 'rpm', ARGV[1]) end
+if ARGV[2] ~= '' then redis.call('hset', KEYS[1], 'tpm', ARGV[2]) end
+if ARGV[3] ~= '' then
+    local requests = tonumber(redis.call('hget', KEYS[1], 'requests')) or tonumber(ARGV[3])
+    redis.call('hset', KEYS[1], 'requests', math.min(requests, tonumber(ARGV[3])))
+end
+if ARGV[4] ~= '' then
+    local tokens = tonumber(redis.call('hget', KEYS[1], 'tokens')) or tonumber(ARGV[4])
+    redis.call('hset', KEYS[1], 'tokens', math.min(tokens, tonumber(ARGV[4])))
+end
+redis.call('expire', KEYS[1], ARGV[5])
+return 1
+"""
+
+# Return or take tokens after a call. An expired bucket is left alone, it is refilled by the
+# next acquire anyway, and recreating it here would leave a hash without a TTL or timestamp.
+RELEASE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return nil
+end
+return redis.call('hincrbyfloat', KEYS[1], 'tokens', ARGV[1])
+"""
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, model_name: str, retry_after: float):
+        super().__init__(f'Rate limit of {model_name} exceeded, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Requests and tokens per minute token buckets per model, shared between workers via Redis.
+
+    Callers take one request and their estimated tokens before calling the LLM and wait
+    for the buckets to refill, up to `max_wait` seconds. The limits and remaining capacity
+    reported in OpenAI's `x-ratelimit-*` headers are fed back into the buckets, so the
+    limiter adapts to the actual account limits and to traffic from other clients. If Redis
+    is unavailable, calls are not limited.
+    """
+
+    def __init__(
+        self,
+        rpm: int = settings.RATE_LIMIT_RPM,
+        tpm: int = settings.RATE_LIMIT_TPM,
+        max_wait: float = settings.RATE_LIMIT_MAX_WAIT,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_wait = max_wait
+
+    @staticmethod
+    def _key(model_name: str) -> str:
+        return f'ratelimit:{model_name}'
+
+    async def acquire(self, model_name: str, tokens: int) -> float:
+        """Wait until `tokens` can be spent on `model_name`. Returns the seconds waited."""
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        delayed = False
+        while True:
+            try:
+                wait = float(
+                    await get_redis().eval(
+                        ACQUIRE_SCRIPT,
+                        1,
+                        self._key(model_name),
+                        self.rpm,
+                        self.tpm,
+                        time.time(),
+                        tokens,
+                        120,
+                    )
+                )
+            except RedisError as e:
+                logger.warning(f'Rate limiter unavailable, not limiting {model_name}: {e}')
+                metrics.increment('ratelimit.unavailable')
+                return time.monotonic() - start
+
+            if wait <= 0:
+                if delayed:
+                    metrics.increment('ratelimit.delayed')
+                return time.monotonic() - start
+
+            if time.monotonic() + wait > deadline:
+                metrics.increment('ratelimit.rejected')
+                raise RateLimitExceeded(model_name, wait)
+            # Jitter keeps the waiting callers from retrying all at once.
+            delayed = True
+            await asyncio.sleep(wait * random.uniform(1.0, 1.2))
+
+    async def release(self, model_name: str, tokens: int) -> None:
+        """Return over-estimated tokens (or take under-estimated ones) after a call."""
+        if not tokens:
+            return
+        try:
+            await get_redis().eval(RELEASE_SCRIPT, 1, self._key(model_name), tokens)
+        except RedisError as e:
+            logger.warning(f'Failed to adjust rate limit of {model_name}: {e}')
+
+    async def update(self, model_name: str, headers: httpx.Headers, status_code: int) -> None:
+        """Feed the provider's rate limit headers back into the buckets."""
+        remaining_requests = headers.get('x-ratelimit-remaining-requests', '')
+        remaining_tokens = headers.get('x-ratelimit-remaining-tokens', '')
+        if status_code == 429:
+            metrics.increment('ratelimit.provider_429')
+            remaining_requests, remaining_tokens = '0', '0'
+
+        try:
+            await get_redis().eval(
+                UPDATE_SCRIPT,
+                1,
+                self._key(model_name),
+                headers.get('x-ratelimit-limit-requests', ''),
+                headers.get('x-ratelimit-limit-tokens', ''),
+                remaining_requests,
+                remaining_tokens,
+                120,
+            )
+        except RedisError as e:
+            logger.warning(f'Failed to update rate limit of {model_name}: {e}')
+
+    async def on_response(self, response: httpx.Response) -> None:
+        """Response hook for the shared LLM client."""
+        if 'x-ratelimit-limit-requests' not in response.headers and response.status_code != 429:
+            return
+        try:
+            model_name = json.loads(response.request.content).get('model')
+        except (ValueError, AttributeError, httpx.RequestNotRead):
+            return
+        if model_name:
+            await self.update(model_name, response.headers, response.status_code)
+
+
+rate_limiter = RateLimiter()
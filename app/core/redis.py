@@ -1,12 +1,41 @@
-import redis
+import logging
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
 
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+_pool: aioredis.ConnectionPool | None = None
+_client: aioredis.Redis | None = None
+
+
+def get_redis() -> aioredis.Redis:
+    """Return the shared asyncio Redis client; connections are opened on first use."""
+    global _pool, _client
+    if _client is None:
+        _pool = aioredis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        )
+        _client = aioredis.Redis(connection_pool=_pool)
+    return _client
+
 
-def initialize_redis():
-    r = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
-    assert r.ping()
-    return r
+async def init_redis() -> None:
+    try:
+        await get_redis().ping()
+    except RedisError as e:
+        logger.error(f'Redis is not reachable, caching is degraded: {e}')
 
 
-redis_client = initialize_redis()
+async def close_redis() -> None:
+    global _pool, _client
+    if _client is not None:
+        await _client.close()
+        await _pool.disconnect()
+        _pool = _client = None
@@ -1,9 +1,17 @@
+import asyncio
 import logging
-from typing import Callable, Generic, Type, TypeVar
+from collections.abc import AsyncIterator
+from typing import Awaitable, Callable, Generic, Type, TypeVar
 
 from app.auth.dependencies import get_current_user
 from app.auth.service import AuthService
+from app.core.rate_limit import RateLimitExceeded
+from app.jobs.queue import job_queue
+from app.jobs.schemas import JobResponse
+from app.utils.streaming import (NDJSON_MEDIA_TYPE, SSE_MEDIA_TYPE,
+                                 encode_event, wants_sse)
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ValidationError
 
 TRequest = TypeVar('TRequest', bound=BaseModel)
@@ -19,6 +27,23 @@ def validate_model(data, model: Type[BaseModel]) -> BaseModel:
         raise HTTPException(status_code=422, detail=f'Validation Error: {ve.errors()}')
 
 
+def error_detail(error: Exception) -> str:
+    """The message shown to clients for a failed service call; the details are only logged."""
+    if isinstance(error, HTTPException):
+        return error.detail
+    if isinstance(error, RateLimitExceeded):
+        return str(error)
+    if isinstance(error, TimeoutError):
+        return 'The AI service did not respond in time'
+    return 'Internal Server Error'
+
+
+def discard_task(task: asyncio.Task) -> None:
+    """Cancel a task whose result is no longer needed, without leaking its exception."""
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
 class BaseServiceHandler(Generic[TRequest, TResponse]):
     def __init__(
         self,
@@ -30,13 +55,44 @@ class BaseServiceHandler(Generic[TRequest, TResponse]):
         self.request_model = request_model
         self.response_model = response_model
 
-    async def handle(self, request: TRequest) -> TResponse:
+    async def lookup(self, request: TRequest) -> TResponse | None:
+        """Return the cached response without executing the service, if there is one."""
+        service = self.service_factory()
+        get_cached_result = getattr(service, 'get_cached_result', None)
+        if get_cached_result is None:
+            return None
+
+        try:
+            query = self.request_model(**request.model_dump())
+            result = await get_cached_result(query)
+        except Exception as e:
+            logging.warning(f'Cache lookup failed in {self.service_factory.__name__}: {e}')
+            return None
+        return validate_model(result, self.response_model) if result is not None else None
+
+    async def handle(self, request: TRequest, looked_up: bool = False) -> TResponse:
+        """Execute the service; `looked_up` tells that `lookup` found no cached result."""
         service = self.service_factory()
         try:
             query = self.request_model(**request.model_dump())
-            result = await service.execute_query(query)
+            if looked_up and hasattr(service, 'get_cached_result'):
+                result = await service.execute_query(query, lookup=False)
+            else:
+                result = await service.execute_query(query)
             return validate_model(result, self.response_model)
 
+        except RateLimitExceeded as re:
+            logging.warning(f'Rate limit in {self.service_factory.__name__}: {re}')
+            raise HTTPException(
+                status_code=429,
+                detail=str(re),
+                headers={'Retry-After': str(max(1, round(re.retry_after)))},
+            )
+
+        except TimeoutError:
+            logging.error(f'Deadline exceeded in {self.service_factory.__name__}')
+            raise HTTPException(status_code=504, detail=error_detail(TimeoutError()))
+
         except AttributeError as ae:
             logging.error(f'Attribute error in {self.service_factory.__name__}: {ae}')
             raise HTTPException(status_code=400, detail=f'Invalid request structure: {ae}')
@@ -53,6 +109,32 @@ class BaseServiceHandler(Generic[TRequest, TResponse]):
             logging.error(f'Unexpected error in {self.service_factory.__name__}: {e}')
             raise HTTPException(status_code=500, detail='Internal Server Error')
 
+    async def stream(
+        self, request: TRequest, on_result: Callable[[TResponse], Awaitable[None]]
+    ) -> AsyncIterator[dict]:
+        """
+        Yield `partial` events while the service streams its result, then a `result` event
+        with the validated response, which is passed to `on_result` first.
+        """
+        service = self.service_factory()
+        try:
+            query = self.request_model(**request.model_dump())
+            async for item in service.stream_query(query):
+                if isinstance(item, BaseModel):
+                    result = validate_model(item, self.response_model)
+                    await on_result(result)
+                    yield {'event': 'result', 'data': result.model_dump()}
+                else:
+                    yield {'event': 'partial', 'data': item}
+
+        except HTTPException as he:
+            logging.warning(f'HTTPException in {self.service_factory.__name__}: {he.detail}')
+            yield {'event': 'error', 'detail': he.detail}
+
+        except Exception as e:
+            logging.error(f'Unexpected error in {self.service_factory.__name__}: {e}')
+            yield {'event': 'error', 'detail': 'Internal Server Error'}
+
 
 class RouteRegistrar:
     def __init__(self, api_router: APIRouter):
@@ -75,16 +157,110 @@ class RouteRegistrar:
             current_user: get_current_user = Depends(get_current_user),
         ) -> response_model:
             service = AuthService(request)
-            valid = await service.check_token_quota()
+
+            # The quota check and the cache lookup run concurrently. Cached results cost no
+            # LLM call, so they need no quota and are not billed.
+            quota_check = asyncio.create_task(service.check_token_quota())
+            try:
+                cached = await handler.lookup(request_model)
+            except BaseException:
+                discard_task(quota_check)
+                raise
+
+            if cached is not None:
+                discard_task(quota_check)
+                service.report_cache_hit(cached)
+                return cached
+
+            valid = await quota_check
             if not valid:
                 raise HTTPException(status_code=403, detail='Token quota exceeded')
 
-            result = await handler.handle(request_model)
+            result = await handler.handle(request_model, looked_up=True)
             await service.consume_tokens(result)
             return result
 
         self.router.post(path, response_model=response_model, tags=tags)(route_function)
 
+    def register_stream_route(
+        self,
+        path: str,
+        request_model: Type[TRequest],
+        response_model: Type[TResponse],
+        service_factory: Callable[[], object],
+        tags: list[str] = None,
+    ):
+        """
+        Register a route streaming the result as NDJSON or, if the client accepts
+        `text/event-stream`, as Server-Sent Events.
+        """
+        handler = BaseServiceHandler(service_factory, request_model, response_model)
+
+        async def route_function(
+            request: Request,
+            request_model: request_model,
+            current_user: get_current_user = Depends(get_current_user),
+        ) -> StreamingResponse:
+            service = AuthService(request)
+
+            quota_check = asyncio.create_task(service.check_token_quota())
+            try:
+                cached = await handler.lookup(request_model)
+            except BaseException:
+                discard_task(quota_check)
+                raise
+
+            if cached is not None:
+                discard_task(quota_check)
+                service.report_cache_hit(cached)
+                events = _single_event({'event': 'result', 'data': cached.model_dump()})
+            elif not await quota_check:
+                raise HTTPException(status_code=403, detail='Token quota exceeded')
+            else:
+                events = handler.stream(request_model, service.consume_tokens)
+
+            sse = wants_sse(request.headers.get('accept'))
+            return StreamingResponse(
+                (encode_event(event, sse) async for event in events),
+                media_type=SSE_MEDIA_TYPE if sse else NDJSON_MEDIA_TYPE,
+            )
+
+        self.router.post(path, response_class=StreamingResponse, tags=tags)(route_function)
+
+    def register_job_route(
+        self,
+        path: str,
+        request_model: Type[TRequest],
+        service_name: str,
+        tags: list[str] = None,
+    ):
+        """
+        Register a route which queues the request as a job and returns its id right away.
+        The result is fetched from `/api/jobs/{job_id}/`.
+        """
+
+        async def route_function(
+            request: Request,
+            request_model: request_model,
+            current_user: get_current_user = Depends(get_current_user),
+        ) -> JobResponse:
+            service = AuthService(request)
+            if not await service.check_token_quota():
+                raise HTTPException(status_code=403, detail='Token quota exceeded')
+
+            job = await job_queue.submit(service_name, request_model, service.user_id)
+            if job is None:
+                raise HTTPException(status_code=503, detail='Job queue is full')
+            return job
+
+        self.router.post(path, response_model=JobResponse, status_code=202, tags=tags)(
+            route_function
+        )
+
+
+async def _single_event(event: dict) -> AsyncIterator[dict]:
+    yield event
+
 
 # Create APIRouter instance
 router = APIRouter(
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import random
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+import openai
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Errors worth another attempt; anything else, e.g. an unparsable completion, is raised.
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+class LatencyTracker:
+    """Sliding window of recent call durations, used to decide when to hedge."""
+
+    def __init__(self, window: int = settings.LLM_LATENCY_WINDOW):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        """The `p` quantile (0..1) of the window, None until enough samples were seen."""
+        if len(self._samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: float | None, name: str) -> T:
+    """
+    Await `call()`; if it has not finished after `delay` seconds, start an identical second
+    call and return whichever succeeds first. The other one is cancelled.
+    """
+    first = asyncio.ensure_future(call())
+    if delay is None:
+        return await first
+
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+
+        metrics.increment('llm.hedged')
+        metrics.increment(f'llm.hedged.{name}')
+        second = asyncio.ensure_future(call())
+        pending.add(second)
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        metrics.increment('llm.hedge_won')
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # Wait for the cancellation, so the caller sees the usage of interrupted calls.
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def with_retries(call: Callable[[], Awaitable[T]], retries: int, name: str) -> T:
+    """Retry transient provider errors up to `retries` times with full-jitter backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return await call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == retries:
+                raise
+            backoff = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2**attempt)
+            metrics.increment('llm.retries')
+            metrics.increment(f'llm.retries.{name}')
+            logger.warning(f'Retrying {name} after {type(e).__name__}: {e}')
+            await asyncio.sleep(random.uniform(0, backoff))
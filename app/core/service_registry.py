@@ -0,0 +1,47 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceRegistry:
+    """
+    Holds one long-lived instance per registered service class.
+
+    Services are stateless between requests, so the LLM client and output parser built
+    in their constructor can be reused instead of being rebuilt for every request.
+    """
+
+    def __init__(self):
+        self._classes: list[type] = []
+        self._instances: dict[type, object] = {}
+
+    def register(self, service_class: type) -> None:
+        if service_class not in self._classes:
+            self._classes.append(service_class)
+
+    def get(self, service_class: type):
+        """Return the shared instance, building it on first use."""
+        instance = self._instances.get(service_class)
+        if instance is None:
+            instance = self._instances[service_class] = service_class()
+        return instance
+
+    def find(self, name: str) -> type | None:
+        """Return the registered class with the given name, e.g. for a queued job."""
+        return next((cls for cls in self._classes if cls.__name__ == name), None)
+
+    def startup(self) -> None:
+        """Build all registered services up front so the first requests do not pay for it."""
+        for service_class in self._classes:
+            self.get(service_class)
+        logger.info(f'Initialized {len(self._instances)} services')
+
+    def clear(self) -> None:
+        self._instances.clear()
+
+    @property
+    def services(self) -> list[type]:
+        return list(self._classes)
+
+
+service_registry = ServiceRegistry()
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.redis import get_redis
+from app.jobs.schemas import JobResponse
+
+logger = logging.getLogger(__name__)
+
+# Store the job and append it to the queue, unless the queue is full.
+ENQUEUE_SCRIPT = """
+if redis.call('llen', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('set', KEYS[2], ARGV[2], 'EX', ARGV[4])
+redis.call('rpush', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class JobQueue:
+    """
+    Bounded Redis queue of service calls, shared between web and worker processes.
+
+    A job is stored as JSON under `job:<id>` and expires `ttl` seconds after its last
+    update, whether it is still queued or finished. Its id is pushed to a Redis list from
+    which the workers pop. Jobs keep the user id only, not the user's token.
+    """
+
+    queue_key = 'jobs:queue'
+
+    def __init__(self, max_size: int = settings.JOB_QUEUE_MAX_SIZE, ttl: int = settings.JOB_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f'job:{job_id}'
+
+    async def submit(self, service_name: str, query: BaseModel, user_id: str) -> JobResponse | None:
+        """Queue a job, returns None if the queue is full."""
+        job = {
+            'id': uuid.uuid4().hex,
+            'service': service_name,
+            'status': 'queued',
+            'query': query.model_dump(mode='json'),
+            'user_id': user_id,
+            'created_at': time.time(),
+        }
+        accepted = await get_redis().eval(
+            ENQUEUE_SCRIPT,
+            2,
+            self.queue_key,
+            self._key(job['id']),
+            job['id'],
+            json.dumps(job),
+            self.max_size,
+            self.ttl,
+        )
+        if not accepted:
+            metrics.increment('jobs.rejected')
+            return None
+
+        metrics.increment('jobs.submitted')
+        return JobResponse(**job)
+
+    async def get(self, job_id: str) -> dict | None:
+        job = await get_redis().get(self._key(job_id))
+        return json.loads(job) if job else None
+
+    async def update(self, job: dict) -> None:
+        await get_redis().set(self._key(job['id']), json.dumps(job), ex=self.ttl)
+
+    async def pop(self) -> dict | None:
+        """Take the next job from the queue, skipping jobs which expired while queued."""
+        redis = get_redis()
+        while job_id := await redis.lpop(self.queue_key):
+            job = await self.get(job_id)
+            if job is not None:
+                return job
+            logger.warning(f'Job {job_id} expired before it was started')
+        return None
+
+    async def requeue(self, job: dict) -> None:
+        """Put an interrupted job back to the front of the queue."""
+        job['status'] = 'queued'
+        await self.update(job)
+        await get_redis().lpush(self.queue_key, job['id'])
+
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        """Return the job once it is finished or `timeout` seconds have passed."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            if job is None or job['status'] in ('done', 'failed'):
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            await asyncio.sleep(min(settings.JOB_POLL_INTERVAL, remaining))
+
+
+job_queue = JobQueue()
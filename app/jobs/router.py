@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+
+from app.auth.dependencies import get_current_user
+from app.core.config import settings
+from app.jobs.queue import job_queue
+from app.jobs.schemas import JobResponse
+
+router = APIRouter(
+    prefix='/api',
+    tags=['Jobs'],
+    responses={404: {'description': 'Not found'}},
+)
+
+
+@router.get('/jobs/{job_id}/', response_model=JobResponse)
+async def get_job(
+    request: Request,
+    job_id: str,
+    wait: float = Query(
+        0.0, ge=0.0, le=settings.JOB_MAX_WAIT, description='Seconds to wait for the result.'
+    ),
+    current_user: get_current_user = Depends(get_current_user),
+) -> JobResponse:
+    """Return a job, waiting up to `wait` seconds for it to finish."""
+    job = await job_queue.wait(job_id, wait) if wait else await job_queue.get(job_id)
+    if job is None or job['user_id'] != request.state.user_id:
+        raise HTTPException(status_code=404, detail='Job not found')
+    return JobResponse(**job)
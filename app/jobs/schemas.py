@@ -0,0 +1,15 @@
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+JobStatus = Literal['queued', 'running', 'done', 'failed']
+
+
+class JobResponse(BaseModel):
+    id: str = Field(..., description='The id of the job.')
+    service: str = Field(..., description='The service running the job.')
+    status: JobStatus = Field(..., description='The status of the job.')
+    result: dict | None = Field(None, description='The result, once the job is done.')
+    error: str | None = Field(None, description='The error, if the job failed.')
+    created_at: float = Field(..., description='Submission time as UNIX timestamp.')
+    finished_at: float | None = Field(None, description='Completion time as UNIX timestamp.')
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+
+from app.auth.quota import quota_ledger
+from app.auth.schemas import ConsumedTokensInfo
+from app.auth.usage import usage_reporter
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.registrar import error_detail
+from app.core.service_registry import service_registry
+from app.jobs.queue import JobQueue, job_queue
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorker:
+    """
+    Pool of `concurrency` loops running queued jobs through the shared service instances.
+
+    Runs inside the web process (`JOB_IN_PROCESS_WORKER`) or standalone via
+    `manage.py worker`. Jobs interrupted by a shutdown are put back into the queue.
+    """
+
+    def __init__(self, queue: JobQueue = job_queue, concurrency: int = settings.JOB_CONCURRENCY):
+        self.queue = queue
+        self.concurrency = concurrency
+        self._tasks: list[asyncio.Task] = []
+
+    async def process(self, job: dict) -> None:
+        job.update(status='running', started_at=time.time())
+        await self.queue.update(job)
+        try:
+            service_class = service_registry.find(job['service'])
+            if service_class is None:
+                raise LookupError(f'Unknown service {job["service"]}')
+            service = service_registry.get(service_class)
+            query = service.QueryModel.model_validate(job['query'])
+            # Jobs are bounded by JOB_TIMEOUT, not by the service's deadline for requests.
+            result = await asyncio.wait_for(
+                service.execute_query(query, use_deadline=False), settings.JOB_TIMEOUT
+            )
+            await self.consume_tokens(job, result)
+            job.update(status='done', result=result.model_dump())
+            metrics.increment('jobs.done')
+
+        except asyncio.CancelledError:
+            await asyncio.shield(self.queue.requeue(job))
+            raise
+
+        except Exception as e:
+            logger.exception(f'Job {job["id"]} for {job["service"]} failed')
+            job.update(status='failed', error=error_detail(e))
+            metrics.increment('jobs.failed')
+
+        job['finished_at'] = time.time()
+        await self.queue.update(job)
+
+    @staticmethod
+    async def consume_tokens(job: dict, result) -> None:
+        """
+        Bill the job's user through the write-behind usage queue; cache hits are free. The
+        job holds no user token, so the usage is sent with the service credential.
+        """
+        tokens_info = result.tokens_info
+        result.tokens_info = None
+        if not tokens_info or tokens_info.get('cache_hit'):
+            return
+
+        payload = ConsumedTokensInfo(**tokens_info).model_dump()
+        if settings.QUOTA_LEDGER_ENABLED:
+            await quota_ledger.consume(job['user_id'], payload['consumed_tokens'])
+        await usage_reporter.record(None, job['user_id'], payload)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                job = await self.queue.pop()
+            except Exception as e:
+                logger.error(f'Failed to fetch a job: {e}')
+                job = None
+
+            if job is None:
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+                continue
+            try:
+                await self.process(job)
+            except Exception as e:
+                logger.error(f'Failed to update job {job["id"]}: {e}')
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def serve(self) -> None:
+        """Run the worker loops until cancelled."""
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+job_worker = JobWorker()
@@ -2,17 +2,26 @@ from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 
 import sentry_sdk
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from app.auth.router import router as auth_router
+from app.auth.usage import usage_reporter
 from app.core.config import settings
 from app.core.health_checks import router as core_router
+from app.core.http import (close_dataservice_client, close_llm_clients,
+                           get_dataservice_client)
 import logging
 from app.core.logger import configure_logging
+from app.core.prompt_registry import prompt_registry
+from app.core.redis import close_redis, init_redis
+from app.core.service_registry import service_registry
+from app.jobs.router import router as jobs_router
+from app.jobs.worker import job_worker
 from app.keywords.router import router as keywords_router
-from app.middleware.custom_error_format import custom_error_format_middleware
+from app.middleware.custom_error_format import CustomErrorFormatMiddleware
 from app.middleware.token_extraction import TokenExtractionMiddleware
+from app.risk.router import router as risk_router
 from app.router import router as base_router
 
 configure_logging()
@@ -22,7 +31,21 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    prompt_registry.preload([service.prompt_name for service in service_registry.services])
+    service_registry.startup()
+    await init_redis()
+    get_dataservice_client()
+    if settings.USAGE_WRITE_BEHIND_ENABLED:
+        usage_reporter.start()
+    if settings.JOB_IN_PROCESS_WORKER:
+        job_worker.start()
     yield
+    await job_worker.stop()
+    await usage_reporter.stop()
+    service_registry.clear()
+    await close_llm_clients()
+    await close_dataservice_client()
+    await close_redis()
 
 
 if settings.IS_PRODUCTION:
@@ -55,16 +78,14 @@ if settings.BACKEND_CORS_ORIGINS:
     )
 
 
-@app.middleware('http')
-async def custom_middleware(request: Request, call_next):
-    return await custom_error_format_middleware(request, call_next)
-
-
+app.add_middleware(CustomErrorFormatMiddleware)
 app.add_middleware(TokenExtractionMiddleware)
 
 
 app.include_router(base_router)
 app.include_router(keywords_router)
+app.include_router(risk_router)
+app.include_router(jobs_router)
 app.include_router(core_router)
 app.include_router(auth_router)
 
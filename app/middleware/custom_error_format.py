@@ -1,15 +1,30 @@
-from fastapi import Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 
-async def custom_error_format_middleware(request: Request, call_next):
-    try:
-        response = await call_next(request)
-        return response
-    except RequestValidationError as exc:
-        errors = exc.errors()
-        return JSONResponse(
-            status_code=422,
-            content={'detail': 'Validation failed', 'errors': errors},
-        )
+class CustomErrorFormatMiddleware:
+    """
+    Middleware to translate a `RequestValidationError` into a 422 response.
+
+    Implemented as plain ASGI middleware, so requests are passed on without an extra task
+    and response bodies are streamed untouched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        except RequestValidationError as exc:
+            response = JSONResponse(
+                status_code=422,
+                content={'detail': 'Validation failed', 'errors': jsonable_encoder(exc.errors())},
+            )
+            await response(scope, receive, send)
@@ -1,33 +1,46 @@
 import logging
 
-from fastapi import HTTPException, Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+from fastapi import HTTPException
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Receive, Scope, Send
 
-from app.auth.auth import get_jwt_payload
+from app.auth.auth import authenticate
 
 logger = logging.getLogger(__name__)
 
 
-class TokenExtractionMiddleware(BaseHTTPMiddleware):
+class TokenExtractionMiddleware:
     """
     Middleware to extract the token from the request and attach it to the request's state.
+
+    Implemented as plain ASGI middleware, so requests are passed on without an extra task
+    and response bodies are streamed untouched.
     """
 
-    async def dispatch(self, request: Request, call_next) -> Response:
-        logger.debug(f'Cookies received in middleware: {request.cookies}')
-        token = request.cookies.get('auth')
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        logger.debug(f'Cookies received in middleware: {connection.cookies}')
+        token = connection.cookies.get('auth')
+
+        connection.state.token = None
+        connection.state.user_id = None
 
         if not token:
             logger.debug("No 'auth' token found in cookies")
 
         if token:
             try:
-                payload = get_jwt_payload(request)
-                request.state.token = token
-                request.state.user_id = payload.get('sub')
+                payload = await authenticate(token)
+                connection.state.token = token
+                connection.state.user_id = payload.get('sub')
             except HTTPException:
-                request.state.token = None
-                request.state.user_id = None
+                pass
 
-        return await call_next(request)
+        await self.app(scope, receive, send)
@@ -1,4 +1,5 @@
 from app.core.ai_service import AIService
+from app.core.config import settings
 from app.project.schemas import (BaseProjectRequest,
                                  CheckProjectContextResponse,
                                  ProjectSummaryResponse)
@@ -9,6 +10,8 @@ class CheckProjectContextService(AIService):
     route_path = '/project/check/context/'
     QueryModel = BaseProjectRequest
     ResultModel = CheckProjectContextResponse
+    cache_timeout = settings.CACHE_STALE_TIMEOUT
+    cache_soft_timeout = settings.CACHE_TIMEOUT
 
 
 class ProjectSummaryService(AIService):
@@ -16,3 +19,4 @@ class ProjectSummaryService(AIService):
     route_path = '/project/summarize/'
     QueryModel = BaseProjectRequest
     ResultModel = ProjectSummaryResponse
+    streaming = True
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+
+from app.core.registrar import error_detail
+from app.core.service_registry import service_registry
+from app.risk.schemas import (RiskAssessmentBatchRequest,
+                              RiskAssessmentBatchResponse,
+                              RiskAssessmentResult)
+from app.risk.service import (RiskDriverService, RiskImpactService,
+                              RiskLikelihoodService)
+from app.utils.cache import get_cached_results
+
+logger = logging.getLogger(__name__)
+
+ASSESSMENT_SERVICES = {
+    'drivers': RiskDriverService,
+    'likelihood': RiskLikelihoodService,
+    'impact': RiskImpactService,
+}
+
+
+class RiskAssessmentBatch:
+    """
+    Runs the requested assessments for many risks which share one project context.
+
+    All items are looked up in the cache at once, only the misses are sent to the LLM, with
+    at most `max_concurrency` calls in flight. The tokens of all calls are summed up, so
+    the batch is billed as a single request.
+    """
+
+    prompt_name = 'risk-assessment-batch'
+
+    def __init__(self, request: RiskAssessmentBatchRequest):
+        context = request.model_dump(exclude={'risks', 'assessments'})
+        self.risks = request.risks
+        self.items = []
+        for index, risk in enumerate(request.risks):
+            for assessment in dict.fromkeys(request.assessments):
+                service = service_registry.get(ASSESSMENT_SERVICES[assessment])
+                query = service.QueryModel(**context, risk=risk)
+                self.items.append((index, assessment, service, query))
+        self.results: list = [None] * len(self.items)
+        self.looked_up = False
+
+    @property
+    def misses(self) -> int:
+        return sum(result is None for result in self.results)
+
+    async def lookup(self) -> None:
+        """Fill in the cached results with a single multi-get."""
+        try:
+            self.results = await get_cached_results(
+                [(service, query) for _, _, service, query in self.items]
+            )
+            self.looked_up = True
+        except Exception as e:
+            logger.warning(f'Batch cache lookup failed: {e}')
+
+    async def run(self, max_concurrency: int) -> RiskAssessmentBatchResponse:
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def execute(service, query):
+            async with semaphore:
+                # The misses of the multi-get are not looked up again one by one.
+                return await service.execute_query(query, lookup=not self.looked_up)
+
+        pending = [i for i, result in enumerate(self.results) if result is None]
+        outcomes = await asyncio.gather(
+            *(execute(*self.items[i][2:]) for i in pending), return_exceptions=True
+        )
+        errors: dict[int, Exception] = {}
+        for i, outcome in zip(pending, outcomes):
+            if isinstance(outcome, BaseException):
+                if not isinstance(outcome, Exception):
+                    raise outcome
+                errors[i] = outcome
+            else:
+                self.results[i] = outcome
+
+        return self._build_response(errors)
+
+    def _build_response(self, errors: dict[int, Exception]) -> RiskAssessmentBatchResponse:
+        assessed = [RiskAssessmentResult(risk=risk) for risk in self.risks]
+        consumed_tokens, total_cost, saved_tokens = 0, 0.0, 0
+        model_name = None
+
+        for i, (index, assessment, service, _) in enumerate(self.items):
+            model_name = model_name or service.model_name
+            if i in errors:
+                logger.error(f'Batch assessment {assessment} failed for risk {index}: {errors[i]}')
+                assessed[index].errors[assessment] = error_detail(errors[i])
+                continue
+
+            result = self.results[i]
+            tokens_info = result.tokens_info or {}
+            consumed_tokens += tokens_info.get('consumed_tokens', 0)
+            total_cost += tokens_info.get('total_cost', 0.0)
+            saved_tokens += tokens_info.get('saved_tokens', 0)
+            result.tokens_info = None
+            setattr(assessed[index], assessment, result)
+
+        tokens_info = {
+            'consumed_tokens': consumed_tokens,
+            'total_cost': total_cost,
+            'prompt_name': self.prompt_name,
+            'model_name': model_name or 'unknown',
+        }
+        if not consumed_tokens:
+            tokens_info.update(cache_hit=True, saved_tokens=saved_tokens)
+        return RiskAssessmentBatchResponse(results=assessed, tokens_info=tokens_info)
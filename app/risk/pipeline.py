@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator
+
+from app.category.schemas import Category, CreateCategoriesRequest
+from app.category.service import CreateRiskCategoriesService
+from app.core.config import settings
+from app.core.registrar import discard_task, error_detail
+from app.core.service_registry import service_registry
+from app.risk.schemas import (Risk, RiskDriversRequest,
+                              RiskIdentificationRequest, RiskImpactRequest,
+                              RiskLikelihoodRequest, RiskMitigationRequest,
+                              RiskRegisterRequest)
+from app.risk.service import (RiskDriverService, RiskIdentificationService,
+                              RiskImpactService, RiskLikelihoodService,
+                              RiskMitigationService)
+
+logger = logging.getLogger(__name__)
+
+
+class RiskRegisterPipeline:
+    """
+    Builds a risk register server-side: categories, then the risks of every category, then
+    the assessments of every risk.
+
+    Independent stages run in parallel, with at most `max_concurrency` LLM calls in flight,
+    and every result is emitted as an event as soon as it is ready. The mitigation of a risk
+    needs its drivers and runs after them. A failing stage emits an `error` event and only
+    skips the stages depending on it.
+
+    The request passes a single quota check, so the fan-out is capped: risks are identified
+    for the first `max_categories` categories and the first `max_risks` identified risks are
+    assessed. Skipped ones are reported in an `error` event.
+    """
+
+    prompt_name = 'risk-register-pipeline'
+
+    def __init__(
+        self,
+        request: RiskRegisterRequest,
+        max_concurrency: int,
+        max_categories: int = settings.PIPELINE_MAX_CATEGORIES,
+        max_risks: int = settings.PIPELINE_MAX_RISKS,
+    ):
+        self.context = request.model_dump(exclude={'assessments'})
+        self.assessments = set(request.assessments)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_categories = max_categories
+        self.remaining_risks = max_risks
+        self.events: asyncio.Queue[dict | None] = asyncio.Queue()
+        self.consumed_tokens = 0
+        self.total_cost = 0.0
+        self.saved_tokens = 0
+        self.model_name = None
+
+    @property
+    def tokens_info(self) -> dict:
+        """The summed usage of all stages which finished so far."""
+        tokens_info = {
+            'consumed_tokens': self.consumed_tokens,
+            'total_cost': self.total_cost,
+            'prompt_name': self.prompt_name,
+            'model_name': self.model_name or 'unknown',
+        }
+        if not self.consumed_tokens:
+            tokens_info.update(cache_hit=True, saved_tokens=self.saved_tokens)
+        return tokens_info
+
+    async def stream(self) -> AsyncIterator[dict]:
+        """Run the pipeline and yield its events; closing the iterator cancels pending stages."""
+        task = asyncio.create_task(self.run())
+        try:
+            while (event := await self.events.get()) is not None:
+                yield event
+            await task
+        finally:
+            if not task.done():
+                discard_task(task)
+
+    async def run(self) -> None:
+        try:
+            categories = await self._call(
+                CreateRiskCategoriesService, 'categories', CreateCategoriesRequest(**self.context)
+            )
+            if categories is not None:
+                selected = await self._limit(categories.categories, self.max_categories, 'risks')
+                await asyncio.gather(*(self._identify(c) for c in selected))
+            await self.events.put({'event': 'done'})
+        finally:
+            await self.events.put(None)
+
+    async def _identify(self, category: Category) -> None:
+        category = Category(name=category.name, description=category.description)
+        query = RiskIdentificationRequest(**self.context, category=category)
+        risks = await self._call(
+            RiskIdentificationService, 'risks', query, category=category.name
+        )
+        if risks is not None:
+            selected = await self._limit(
+                risks.risks, self.remaining_risks, 'assessments', category=category.name
+            )
+            self.remaining_risks -= len(selected)
+            await asyncio.gather(*(self._assess(category, risk) for risk in selected))
+
+    async def _limit(self, items: list, limit: int, stage: str, **labels) -> list:
+        """The first `limit` items; reports the skipped ones as an error of `stage`."""
+        if len(items) > limit:
+            detail = f'Limit reached, {len(items) - limit} of {len(items)} items are skipped'
+            await self.events.put({'event': 'error', 'stage': stage, **labels, 'detail': detail})
+        return items[:limit]
+
+    async def _assess(self, category: Category, risk: Risk) -> None:
+        labels = {'category': category.name, 'risk': risk.title}
+        stages = []
+        if self.assessments & {'drivers', 'mitigation'}:
+            stages.append(self._drivers_and_mitigation(risk, labels))
+        if 'likelihood' in self.assessments:
+            query = RiskLikelihoodRequest(**self.context, risk=risk)
+            stages.append(self._call(RiskLikelihoodService, 'likelihood', query, **labels))
+        if 'impact' in self.assessments:
+            query = RiskImpactRequest(**self.context, risk=risk)
+            stages.append(self._call(RiskImpactService, 'impact', query, **labels))
+        await asyncio.gather(*stages)
+
+    async def _drivers_and_mitigation(self, risk: Risk, labels: dict) -> None:
+        query = RiskDriversRequest(**self.context, risk=risk)
+        drivers = await self._call(
+            RiskDriverService, 'drivers', query, emit='drivers' in self.assessments, **labels
+        )
+        if drivers is not None and 'mitigation' in self.assessments:
+            query = RiskMitigationRequest(**self.context, risk=risk, drivers=drivers.drivers)
+            await self._call(RiskMitigationService, 'mitigation', query, **labels)
+
+    async def _call(self, service_class: type, stage: str, query, emit: bool = True, **labels):
+        service = service_registry.get(service_class)
+        try:
+            async with self.semaphore:
+                result = await service.execute_query(query)
+        except Exception as e:
+            logger.error(f'Risk register stage {stage} failed for {labels}: {e}')
+            detail = error_detail(e)
+            await self.events.put({'event': 'error', 'stage': stage, **labels, 'detail': detail})
+            return None
+
+        tokens_info = result.tokens_info or {}
+        self.consumed_tokens += tokens_info.get('consumed_tokens', 0)
+        self.total_cost += tokens_info.get('total_cost', 0.0)
+        self.saved_tokens += tokens_info.get('saved_tokens', 0)
+        self.model_name = self.model_name or service.model_name
+        if emit:
+            data = result.model_dump(exclude={'tokens_info'})
+            await self.events.put({'event': stage, **labels, 'data': data})
+        return result
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from contextlib import aclosing
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from app.auth.dependencies import get_current_user
+from app.auth.service import AuthService
+from app.core.config import settings
+from app.core.registrar import discard_task
+from app.risk.batch import RiskAssessmentBatch
+from app.risk.pipeline import RiskRegisterPipeline
+from app.risk.schemas import (RiskAssessmentBatchRequest,
+                              RiskAssessmentBatchResponse, RiskRegisterRequest)
+from app.utils.schema import BaseResponseModel
+from app.utils.streaming import (NDJSON_MEDIA_TYPE, SSE_MEDIA_TYPE,
+                                 encode_event, wants_sse)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix='/api',
+    tags=['Risk'],
+    responses={404: {'description': 'Not found'}},
+)
+
+
+@router.post('/risk/assessment/batch/', response_model=RiskAssessmentBatchResponse)
+async def assess_risks(
+    request: Request,
+    batch_request: RiskAssessmentBatchRequest,
+    current_user: get_current_user = Depends(get_current_user),
+) -> RiskAssessmentBatchResponse:
+    service = AuthService(request)
+    batch = RiskAssessmentBatch(batch_request)
+
+    quota_check = asyncio.create_task(service.check_token_quota())
+    try:
+        await batch.lookup()
+    except BaseException:
+        discard_task(quota_check)
+        raise
+
+    if not batch.misses:
+        discard_task(quota_check)
+    elif not await quota_check:
+        raise HTTPException(status_code=403, detail='Token quota exceeded')
+
+    result = await batch.run(settings.BATCH_MAX_CONCURRENCY)
+    await service.consume_tokens(result)
+    return result
+
+
+@router.post('/risk/register/stream/', response_class=StreamingResponse)
+async def stream_risk_register(
+    request: Request,
+    register_request: RiskRegisterRequest,
+    current_user: get_current_user = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Build a complete risk register and stream every result as soon as it is ready, as NDJSON
+    or, if the client accepts `text/event-stream`, as Server-Sent Events.
+    """
+    service = AuthService(request)
+    if not await service.check_token_quota():
+        raise HTTPException(status_code=403, detail='Token quota exceeded')
+
+    pipeline = RiskRegisterPipeline(register_request, settings.BATCH_MAX_CONCURRENCY)
+    sse = wants_sse(request.headers.get('accept'))
+
+    async def content():
+        try:
+            async with aclosing(pipeline.stream()) as events:
+                async for event in events:
+                    yield encode_event(event, sse)
+        finally:
+            # Bill whatever was computed, also if the client disconnected early.
+            usage = BaseResponseModel(tokens_info=pipeline.tokens_info)
+            try:
+                await asyncio.shield(service.consume_tokens(usage))
+            except Exception as e:
+                logger.error(f'Failed to bill risk register pipeline: {e}')
+
+    return StreamingResponse(content(), media_type=SSE_MEDIA_TYPE if sse else NDJSON_MEDIA_TYPE)
@@ -1,6 +1,9 @@
+from typing import ClassVar, Literal
+
 from pydantic import BaseModel, Field
 
 from app.category.schemas import Category
+from app.core.config import settings
 from app.project.schemas import BaseProjectRequest
 from app.utils.schema import BaseResponseModel
 
@@ -23,6 +26,8 @@ class RiskDefinitionCheckResponse(BaseResponseModel):
 
 
 class RiskIdentificationRequest(BaseProjectRequest):
+    cache_order_insensitive: ClassVar[set[str]] = {'existing'}
+
     category: Category = Field(..., description='The category of the risks to be identified.')
     existing: list[Risk] = Field([], description='The existing risks.')
 
@@ -35,33 +40,55 @@ class RiskDriversRequest(BaseProjectRequest):
     risk: Risk = Field(..., description='The risk to be assessed.')
 
 
-class RiskDriversResponse(BaseResponseModel):
+class RiskDriversAssessment(BaseModel):
     drivers: list[str] = Field(..., description='The drivers of the risk.')
     explanation: str = Field(..., description='Explanation of the drivers classification.')
     sources: list[str] = Field(..., description='The sources of the drivers classification.')
 
 
+class RiskDriversResponse(RiskDriversAssessment, BaseResponseModel):
+    pass
+
+
 class RiskLikelihoodRequest(BaseProjectRequest):
     risk: Risk = Field(..., description='The risk to be assessed.')
 
 
-class RiskLikelihoodResponse(BaseResponseModel):
+class RiskLikelihoodAssessment(BaseModel):
     likelihood: str = Field(..., description='The likelihood of the risk: low, medium, high.')
     explanation: str = Field(..., description='Explanation of the likelihood classification.')
     sources: list[str] = Field(..., description='The sources of the likelihood classification.')
 
 
+class RiskLikelihoodResponse(RiskLikelihoodAssessment, BaseResponseModel):
+    pass
+
+
 class RiskImpactRequest(BaseProjectRequest):
     risk: Risk = Field(..., description='The risk to be assessed.')
 
 
-class RiskImpactResponse(BaseResponseModel):
+class RiskImpactAssessment(BaseModel):
     impacts: list[str] = Field(..., description='The impacts of the risk.')
     level: str = Field(..., description='The level of the impact: low, medium, high.')
     explanation: str = Field(..., description='Explanation of the impact classification.')
     sources: list[str] = Field(..., description='The sources of the impact classification.')
 
 
+class RiskImpactResponse(RiskImpactAssessment, BaseResponseModel):
+    pass
+
+
+class RiskAssessmentRequest(BaseProjectRequest):
+    risk: Risk = Field(..., description='The risk to be assessed.')
+
+
+class RiskAssessmentResponse(BaseResponseModel):
+    drivers: RiskDriversAssessment = Field(..., description='The drivers of the risk.')
+    likelihood: RiskLikelihoodAssessment = Field(..., description='The likelihood of the risk.')
+    impact: RiskImpactAssessment = Field(..., description='The impact of the risk.')
+
+
 class RiskMitigationRequest(BaseProjectRequest):
     risk: Risk = Field(..., description='The risk to be assessed.')
     drivers: list[str] = Field(..., description='The drivers of the risk.')
@@ -71,3 +98,40 @@ class RiskMitigationResponse(BaseResponseModel):
     mitigation: str = Field(..., description='The mitigation of the risk.')
     explanation: str = Field(..., description='Explanation of the mitigation classification.')
     sources: list[str] = Field(..., description='The sources of the mitigation classification.')
+
+
+RiskAssessment = Literal['drivers', 'likelihood', 'impact']
+
+
+class RiskAssessmentBatchRequest(BaseProjectRequest):
+    risks: list[Risk] = Field(
+        ..., max_length=settings.BATCH_MAX_RISKS, description='The risks to be assessed.'
+    )
+    assessments: list[RiskAssessment] = Field(
+        ['drivers', 'likelihood', 'impact'], description='The assessments to run for each risk.'
+    )
+
+
+class RiskAssessmentResult(BaseModel):
+    risk: Risk = Field(..., description='The assessed risk.')
+    drivers: RiskDriversResponse | None = Field(None, description='The drivers of the risk.')
+    likelihood: RiskLikelihoodResponse | None = Field(
+        None, description='The likelihood of the risk.'
+    )
+    impact: RiskImpactResponse | None = Field(None, description='The impact of the risk.')
+    errors: dict[str, str] = Field(
+        default_factory=dict, description='Assessments which failed, with the reason.'
+    )
+
+
+class RiskAssessmentBatchResponse(BaseResponseModel):
+    results: list[RiskAssessmentResult] = Field(
+        ..., description='The assessments in the order of the requested risks.'
+    )
+
+
+class RiskRegisterRequest(BaseProjectRequest):
+    assessments: list[Literal['drivers', 'likelihood', 'impact', 'mitigation']] = Field(
+        ['drivers', 'likelihood', 'impact', 'mitigation'],
+        description='The assessments to run for each identified risk.',
+    )
@@ -1,11 +1,18 @@
+import asyncio
+
 from app.core.ai_service import AIService
-from app.risk.schemas import (RiskDefinitionCheckRequest,
+from app.core.config import settings
+from app.core.model_routing import ModelRoute
+from app.core.service_registry import service_registry
+from app.risk.schemas import (RiskAssessmentRequest, RiskAssessmentResponse,
+                              RiskDefinitionCheckRequest,
                               RiskDefinitionCheckResponse, RiskDriversRequest,
                               RiskDriversResponse, RiskIdentificationRequest,
                               RiskIdentificationResponse, RiskImpactRequest,
                               RiskImpactResponse, RiskLikelihoodRequest,
                               RiskLikelihoodResponse, RiskMitigationRequest,
                               RiskMitigationResponse)
+from app.utils.cache import store_cached_result
 
 
 class RiskDefinitionService(AIService):
@@ -13,6 +20,7 @@ class RiskDefinitionService(AIService):
     route_path = '/risk/check/definition/'
     QueryModel = RiskDefinitionCheckRequest
     ResultModel = RiskDefinitionCheckResponse
+    model_route = ModelRoute(primary=settings.OPENAI_MODEL_NAME, fallbacks=['gpt-4o'])
 
 
 class RiskIdentificationService(AIService):
@@ -20,6 +28,13 @@ class RiskIdentificationService(AIService):
     route_path = '/risk/identify/'
     QueryModel = RiskIdentificationRequest
     ResultModel = RiskIdentificationResponse
+    model_route = ModelRoute(
+        primary=settings.OPENAI_MODEL_NAME,
+        fallbacks=['gpt-4o'],
+        escalate_on={'parse_error', 'timeout', 'input_size'},
+        max_input_tokens=8000,
+    )
+    deadline = settings.LLM_LONG_DEADLINE
 
 
 class RiskDriverService(AIService):
@@ -27,6 +42,8 @@ class RiskDriverService(AIService):
     route_path = '/risk/drivers/'
     QueryModel = RiskDriversRequest
     ResultModel = RiskDriversResponse
+    similarity_fields = ('risk',)
+    hedge_percentile = 0.95
 
 
 class RiskLikelihoodService(AIService):
@@ -34,6 +51,8 @@ class RiskLikelihoodService(AIService):
     route_path = '/risk/likelihood/'
     QueryModel = RiskLikelihoodRequest
     ResultModel = RiskLikelihoodResponse
+    similarity_fields = ('risk',)
+    hedge_percentile = 0.95
 
 
 class RiskImpactService(AIService):
@@ -41,6 +60,64 @@ class RiskImpactService(AIService):
     route_path = '/risk/impact/'
     QueryModel = RiskImpactRequest
     ResultModel = RiskImpactResponse
+    similarity_fields = ('risk',)
+    hedge_percentile = 0.95
+
+
+class RiskAssessmentService(AIService):
+    """
+    Assesses drivers, likelihood and impact of a risk with a single prompt.
+
+    The parts of a computed result are also cached for the single-assessment services, so
+    later calls to these services hit the cache. Parts are only cached for services which
+    use the model that produced the result, as the model is part of their cache keys.
+    """
+
+    prompt_name = 'risk-assessment'
+    route_path = '/risk/assessment/'
+    QueryModel = RiskAssessmentRequest
+    ResultModel = RiskAssessmentResponse
+
+    parts = {
+        'drivers': RiskDriverService,
+        'likelihood': RiskLikelihoodService,
+        'impact': RiskImpactService,
+    }
+
+    async def run_query(
+        self, query: RiskAssessmentRequest, use_deadline: bool = True
+    ) -> RiskAssessmentResponse:
+        result = await super().run_query(query, use_deadline=use_deadline)
+        await self.store_parts(query, result)
+        return result
+
+    async def store_parts(self, query: RiskAssessmentRequest, result: RiskAssessmentResponse):
+        # The parts report an even share of the tokens, which later hits count as saved.
+        share = {
+            key: result.tokens_info[key] / len(self.parts)
+            for key in ('consumed_tokens', 'total_cost')
+        }
+        share['consumed_tokens'] = int(share['consumed_tokens'])
+
+        model_name = (result.routing or {}).get('model') or result.tokens_info['model_name']
+        stores = []
+        for name, service_class in self.parts.items():
+            service = service_registry.get(service_class)
+            if service.model_name != model_name:
+                continue
+            tokens_info = {
+                **share,
+                'prompt_name': service.prompt_name,
+                'model_name': model_name,
+            }
+            part = service.ResultModel(
+                **getattr(result, name).model_dump(),
+                tokens_info=tokens_info,
+                routing=result.routing,
+            )
+            part_query = service.QueryModel(**query.model_dump())
+            stores.append(store_cached_result(service, part_query, part))
+        await asyncio.gather(*stores)
 
 
 class RiskMitigationService(AIService):
@@ -48,3 +125,4 @@ class RiskMitigationService(AIService):
     route_path = '/risk/mitigation/'
     QueryModel = RiskMitigationRequest
     ResultModel = RiskMitigationResponse
+    streaming = True
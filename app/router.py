@@ -4,6 +4,7 @@ from fastapi import APIRouter
 
 from app.category import service as category_service
 from app.core.registrar import RouteRegistrar
+from app.core.service_registry import service_registry
 from app.project import service as project_service
 from app.risk import service as risk_service
 
@@ -34,11 +35,26 @@ registrar = RouteRegistrar(router)
 for service_class in services:
     module_name = service_class.__module__.split('.')[-2]
     tags = [module_name.capitalize()]
+    service_registry.register(service_class)
 
     registrar.register_route(
         path=service_class.route_path,  # Use route path defined in the service
         request_model=service_class.QueryModel,
         response_model=service_class.ResultModel,
-        service_factory=lambda cls=service_class: cls(),  # Dynamically instantiate
+        service_factory=lambda cls=service_class: service_registry.get(cls),  # Shared instance
         tags=tags,
     )
+    registrar.register_job_route(
+        path=f'/jobs{service_class.route_path}',
+        request_model=service_class.QueryModel,
+        service_name=service_class.__name__,
+        tags=tags,
+    )
+    if service_class.streaming:
+        registrar.register_stream_route(
+            path=f'{service_class.route_path}stream/',
+            request_model=service_class.QueryModel,
+            response_model=service_class.ResultModel,
+            service_factory=lambda cls=service_class: service_registry.get(cls),
+            tags=tags,
+        )
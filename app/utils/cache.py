@@ -1,33 +1,405 @@
+import asyncio
+import functools
 import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from redis.exceptions import RedisError
 
 from app.core.config import settings
-from app.core.redis import initialize_redis
+from app.core.metrics import metrics
+from app.core.redis import get_redis
+from app.utils.local_cache import LocalCache
+from app.utils.similarity import SimilarityIndex, split_query
+from app.utils.single_flight import SingleFlight
+
+local_cache = LocalCache(
+    max_entries=settings.CACHE_L1_MAX_ENTRIES,
+    max_bytes=settings.CACHE_L1_MAX_BYTES,
+    ttl=settings.CACHE_L1_TIMEOUT,
+)
+single_flight = SingleFlight()
+_background_tasks: set[asyncio.Task] = set()
+similarity_indexes: dict[str, SimilarityIndex] = {}
+
+# Delete the lock only if it is still held by the caller.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
 
 
-def redis_cache(timeout: int = settings.CACHE_TIMEOUT, redis_client=None):
+def _without_tokens(result):
+    """
+    Copy of a result which did not cost the caller an LLM call, e.g. a cache hit.
+
+    The tokens are billed only to the caller which triggered the LLM call; the copy reports
+    zero consumed tokens and keeps the original count as `saved_tokens`.
+    """
+    result = result.model_copy(deep=True)
+    if result.tokens_info:
+        result.tokens_info = {
+            **result.tokens_info,
+            'consumed_tokens': 0,
+            'total_cost': 0.0,
+            'cache_hit': True,
+            'saved_tokens': result.tokens_info.get('consumed_tokens', 0),
+        }
+    return result
+
+
+def _get_timeouts(service, timeout: int | None) -> tuple[int | None, int | None]:
+    """The hard and soft timeout of a service's entries; `timeout` unless it overrides it."""
+    cache_timeout = getattr(service, 'cache_timeout', None)
+    soft_timeout = getattr(service, 'cache_soft_timeout', None)
+    return (timeout if cache_timeout is None else cache_timeout), soft_timeout
+
+
+def _similarity_context(service, query) -> tuple[SimilarityIndex, str, str] | None:
+    """Return the index, partition and text for services which opted into similarity lookups."""
+    fields = getattr(service, 'similarity_fields', ())
+    if not settings.SIMILARITY_CACHE_ENABLED or not fields:
+        return None
+
+    name = type(service).__name__
+    index = similarity_indexes.get(name)
+    if index is None:
+        index = similarity_indexes[name] = SimilarityIndex(settings.SIMILARITY_CACHE_MAX_ENTRIES)
+    partition, text = split_query(query, fields)
+    return index, partition, text
+
+
+async def _get_cached(client, cache_key: str) -> str | None:
+    try:
+        return await client.get(cache_key)
+    except RedisError as e:
+        logging.warning(f'Cache lookup failed for key {cache_key}: {e}')
+        return None
+
+
+async def _get_cached_entry(
+    client, cache_key: str, soft_timeout: int | None
+) -> tuple[str | None, bool]:
+    """Return the cached value and whether it is still within its soft timeout."""
+    if soft_timeout is None:
+        return await _get_cached(client, cache_key), True
+    try:
+        cached_result, fresh = await client.mget(cache_key, f'fresh:{cache_key}')
+        return cached_result, fresh is not None
+    except RedisError as e:
+        logging.warning(f'Cache lookup failed for key {cache_key}: {e}')
+        return None, True
+
+
+async def _set_cached(
+    client, cache_key: str, value: str, timeout: int | None, soft_timeout: int | None = None
+) -> None:
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.set(cache_key, value, ex=timeout)
+            if soft_timeout is not None:
+                pipe.set(f'fresh:{cache_key}', 1, ex=soft_timeout)
+            await pipe.execute()
+        logging.info(f'Cache miss, key stored: {cache_key}')
+    except RedisError as e:
+        logging.warning(f'Failed to store cache key {cache_key}: {e}')
+
+
+async def _acquire_lock(client, lock_key: str, token: str) -> bool:
+    try:
+        return bool(await client.set(lock_key, token, nx=True, ex=settings.CACHE_LOCK_TIMEOUT))
+    except RedisError as e:
+        logging.warning(f'Failed to acquire cache lock {lock_key}: {e}')
+        # Without Redis there is nothing to coordinate, compute locally.
+        return True
+
+
+async def _release_lock(client, lock_key: str, token: str) -> None:
+    try:
+        await client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+    except RedisError as e:
+        logging.warning(f'Failed to release cache lock {lock_key}: {e}')
+
+
+async def _wait_for_other_worker(client, cache_key: str, lock_key: str) -> str | None:
+    """Poll for the result of another worker until its lock is released or times out."""
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(settings.CACHE_LOCK_POLL_INTERVAL)
+        cached_result = await _get_cached(client, cache_key)
+        if cached_result:
+            return cached_result
+        try:
+            if not await client.exists(lock_key):
+                return None
+        except RedisError:
+            return None
+    return None
+
+
+async def _compute(service, client, cache_key: str, call: Callable[[], Awaitable[Any]], timeout):
+    """Run `call` and store its result, coordinating with other workers if configured."""
+    lock_key = f'lock:{cache_key}'
+    token = uuid.uuid4().hex
+    if settings.CACHE_LOCK_ENABLED and not await _acquire_lock(client, lock_key, token):
+        cached_result = await _wait_for_other_worker(client, cache_key, lock_key)
+        if cached_result:
+            metrics.increment('cache.coalesced')
+            return _without_tokens(service.ResultModel.parse_raw(cached_result))
+
+    try:
+        result = await call()
+        await _set_cached(client, cache_key, result.json(), *_get_timeouts(service, timeout))
+    finally:
+        if settings.CACHE_LOCK_ENABLED:
+            await _release_lock(client, lock_key, token)
+    return result
+
+
+async def _refresh(service, client, cache_key: str, call, timeout, use_local_cache: bool):
+    refresh_key = f'refresh:{cache_key}'
+    token = uuid.uuid4().hex
+    if not await _acquire_lock(client, refresh_key, token):
+        return  # another worker is already refreshing this entry
+    try:
+        result, _ = await single_flight.do(
+            cache_key, lambda: _compute(service, client, cache_key, call, timeout)
+        )
+        if use_local_cache:
+            local_cache.set(cache_key, result, len(result.json()))
+        metrics.increment('cache.refresh')
+        logging.info(f'Cache entry refreshed: {cache_key} ({result.tokens_info})')
+    except Exception as e:
+        logging.error(f'Failed to refresh cache entry {cache_key}: {e}')
+    finally:
+        await _release_lock(client, refresh_key, token)
+
+
+def _schedule_refresh(service, client, cache_key: str, call, timeout, use_local_cache: bool):
+    if cache_key in single_flight:
+        return
+    task = asyncio.create_task(
+        _refresh(service, client, cache_key, call, timeout, use_local_cache)
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _find_similar(service, client, similarity, use_local_cache: bool):
+    index, partition, text = similarity
+    threshold = getattr(service, 'similarity_threshold', None)
+    match = index.find(partition, text, threshold or settings.SIMILARITY_CACHE_THRESHOLD)
+    if match is None:
+        metrics.increment('cache.similar.miss')
+        return None
+
+    similar_key, score = match
+    local_result = local_cache.get(similar_key) if use_local_cache else None
+    if local_result is not None:
+        result = local_result
+    else:
+        cached_result = await _get_cached(client, similar_key)
+        if not cached_result:
+            index.remove(similar_key)
+            metrics.increment('cache.similar.miss')
+            return None
+        result = service.ResultModel.parse_raw(cached_result)
+
+    metrics.increment('cache.similar.hit')
+    logging.info(f'Similar cache hit for key: {similar_key} (score {score:.3f})')
+    return _without_tokens(result)
+
+
+async def _lookup(service, client, cache_key: str, query, call, timeout, use_local_cache: bool):
+    """
+    Look up `cache_key` in the local cache, Redis and the similarity index.
+
+    Returns the result (or None) and the similarity context to register a computed result.
+    """
+    if use_local_cache:
+        local_result = local_cache.get(cache_key)
+        if local_result is not None:
+            metrics.increment('cache.l1.hit')
+            logging.debug(f'Local cache hit for key: {cache_key}')
+            return _without_tokens(local_result), None
+        metrics.increment('cache.l1.miss')
+
+    similarity = _similarity_context(service, query)
+    _, soft_timeout = _get_timeouts(service, timeout)
+    cached_result, fresh = await _get_cached_entry(client, cache_key, soft_timeout)
+    if cached_result:
+        metrics.increment('cache.l2.hit')
+        logging.info(f'Cache hit for key: {cache_key}')
+        if not fresh and call is not None:
+            metrics.increment('cache.l2.stale')
+            _schedule_refresh(service, client, cache_key, call, timeout, use_local_cache)
+        result = service.ResultModel.parse_raw(cached_result)
+        if use_local_cache:
+            local_cache.set(cache_key, result, len(cached_result))
+        if similarity is not None:
+            similarity[0].add(similarity[1], similarity[2], cache_key)
+        return _without_tokens(result), similarity
+    metrics.increment('cache.l2.miss')
+
+    if similarity is not None:
+        return await _find_similar(service, client, similarity, use_local_cache), similarity
+    return None, None
+
+
+async def get_cached_result(
+    service,
+    query,
+    refresh: Callable[[], Awaitable[Any]] | None = None,
+    timeout: int | None = settings.CACHE_TIMEOUT,
+    redis_client=None,
+    use_local_cache: bool = settings.CACHE_L1_ENABLED,
+):
+    """
+    Return the cached result for `query` without computing it on a miss.
+
+    Cache hits report zero consumed tokens. `refresh` recomputes the result if a stale
+    entry is found for a service with a soft timeout.
+    """
+    client = redis_client if redis_client is not None else get_redis()
+    cache_key = service.generate_cache_key(query)
+    result, _ = await _lookup(service, client, cache_key, query, refresh, timeout, use_local_cache)
+    return result
+
+
+async def get_cached_results(
+    items: list[tuple[Any, Any]],
+    redis_client=None,
+    use_local_cache: bool = settings.CACHE_L1_ENABLED,
+) -> list:
+    """
+    Look up many `(service, query)` pairs at once: the local cache first, then a single
+    Redis MGET for the rest. Returns the results in order, None for misses.
+
+    Unlike `get_cached_result`, this neither refreshes stale entries nor matches similar
+    queries.
+    """
+    client = redis_client if redis_client is not None else get_redis()
+    keys = [service.generate_cache_key(query) for service, query in items]
+    results = [None] * len(items)
+
+    missing = []
+    for i, cache_key in enumerate(keys):
+        local_result = local_cache.get(cache_key) if use_local_cache else None
+        if local_result is not None:
+            metrics.increment('cache.l1.hit')
+            results[i] = _without_tokens(local_result)
+        else:
+            missing.append(i)
+    if not missing:
+        return results
+
+    try:
+        values = await client.mget([keys[i] for i in missing])
+    except RedisError as e:
+        logging.warning(f'Cache lookup failed for {len(missing)} keys: {e}')
+        values = [None] * len(missing)
+
+    for i, cached_result in zip(missing, values):
+        if not cached_result:
+            metrics.increment('cache.l2.miss')
+            continue
+        metrics.increment('cache.l2.hit')
+        result = items[i][0].ResultModel.parse_raw(cached_result)
+        if use_local_cache:
+            local_cache.set(keys[i], result, len(cached_result))
+        results[i] = _without_tokens(result)
+    return results
+
+
+async def store_cached_result(
+    service,
+    query,
+    result,
+    timeout: int | None = settings.CACHE_TIMEOUT,
+    redis_client=None,
+    use_local_cache: bool = settings.CACHE_L1_ENABLED,
+) -> None:
+    """Store a result computed outside of `redis_cache`, e.g. one assembled from a stream."""
+    client = redis_client if redis_client is not None else get_redis()
+    cache_key = service.generate_cache_key(query)
+    value = result.json()
+    await _set_cached(client, cache_key, value, *_get_timeouts(service, timeout))
+    if use_local_cache:
+        local_cache.set(cache_key, result.model_copy(deep=True), len(value))
+    similarity = _similarity_context(service, query)
+    if similarity is not None:
+        similarity[0].add(similarity[1], similarity[2], cache_key)
+
+
+def redis_cache(
+    timeout: int | None = settings.CACHE_TIMEOUT,
+    redis_client=None,
+    use_local_cache: bool = settings.CACHE_L1_ENABLED,
+):
     """
     Decorator for caching results in Redis with default timeout and client.
 
-    :param redis_client: Redis client instance (default: initializes a new client).
-    :param timeout: Cache expiration time in seconds (default: 300 seconds).
+    Parsed results are additionally kept in a bounded in-process LRU (L1) in front of
+    Redis (L2). Concurrent misses for the same key are coalesced into a single call
+    within the worker and, if `CACHE_LOCK_ENABLED` is set, across workers through a short
+    Redis lock. Redis errors and timeouts are logged and treated as a cache miss, so an
+    unavailable Redis only costs the cached call its socket timeout. Results which did not
+    trigger the call (cache hits, coalesced calls) report zero consumed tokens.
+
+    Services which declare `similarity_fields` are also matched against recently cached
+    queries whose text in these fields is nearly identical (`SIMILARITY_CACHE_ENABLED`).
+
+    Callers which already found no cached result, e.g. through `get_cached_result`, pass
+    `lookup=False` to go straight to the call without asking the caches again.
+
+    Services can override the expiration with a `cache_timeout` attribute and enable
+    stale-while-revalidate with `cache_soft_timeout`: entries older than the soft timeout
+    are still returned, while a single background task refreshes them. Keep the hard
+    timeout finite, entries without expiry are never evicted under Redis' default
+    `noeviction` and the `volatile-*` policies.
+
+    :param redis_client: Redis client instance (default: the shared asyncio client).
+    :param timeout: Default cache expiration time in seconds (default: settings.CACHE_TIMEOUT).
+    :param use_local_cache: Whether to use the in-process L1 cache.
     """
-    if redis_client is None:
-        redis_client = initialize_redis()
 
     def decorator(func):
-        async def wrapper(self, query, *args, **kwargs):
+        @functools.wraps(func)
+        async def wrapper(self, query, *args, lookup: bool = True, **kwargs):
+            client = redis_client if redis_client is not None else get_redis()
+
             # Generate a cache key based on the query and service parameters
             # the class must define a `generate_cache_key` method
             cache_key = self.generate_cache_key(query, *args, **kwargs)
-            cached_result = redis_client.get(cache_key)
-            if cached_result:
-                logging.info(f'Cache hit for key: {cache_key}')
-                return self.ResultModel.parse_raw(cached_result)
-
-            result = await func(self, query, *args, **kwargs)
-            redis_client.set(cache_key, result.json(), ex=timeout)
-            logging.info(f'Cache miss, key stored: {cache_key}')
-            return result
+
+            def call():
+                return func(self, query, *args, **kwargs)
+
+            if lookup:
+                result, similarity = await _lookup(
+                    self, client, cache_key, query, call, timeout, use_local_cache
+                )
+                if result is not None:
+                    return result
+            else:
+                similarity = _similarity_context(self, query)
+
+            result, shared = await single_flight.do(
+                cache_key, lambda: _compute(self, client, cache_key, call, timeout)
+            )
+            if shared:
+                metrics.increment('cache.coalesced')
+                return _without_tokens(result)
+
+            if use_local_cache:
+                local_cache.set(cache_key, result, len(result.json()))
+            if similarity is not None:
+                similarity[0].add(similarity[1], similarity[2], cache_key)
+            # The same object is shared with coalesced callers and the local cache.
+            return result.model_copy(deep=True)
 
         return wrapper
 
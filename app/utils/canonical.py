@@ -0,0 +1,46 @@
+import json
+import re
+import unicodedata
+from typing import Any
+
+from pydantic import BaseModel
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _sort_key(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+def canonicalize(value: Any, case_insensitive: bool = False) -> Any:
+    """
+    Convert a query model into a canonical, JSON serializable form for cache keys.
+
+    Strings are NFKC normalized and whitespace is collapsed. Models can declare fields
+    whose order (`cache_order_insensitive`) or case (`cache_case_insensitive`) does not
+    affect the result, these are sorted or case folded respectively.
+    """
+    if isinstance(value, BaseModel):
+        model = type(value)
+        order_insensitive = getattr(model, 'cache_order_insensitive', set())
+        case_insensitive_fields = getattr(model, 'cache_case_insensitive', set())
+
+        result = {}
+        for name in model.model_fields:
+            field_value = canonicalize(getattr(value, name), name in case_insensitive_fields)
+            if name in order_insensitive and isinstance(field_value, list):
+                field_value = sorted(field_value, key=_sort_key)
+            result[name] = field_value
+        return result
+
+    if isinstance(value, str):
+        text = _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', value)).strip()
+        return text.casefold() if case_insensitive else text
+
+    if isinstance(value, list | tuple):
+        return [canonicalize(item, case_insensitive) for item in value]
+
+    if isinstance(value, dict):
+        return {key: canonicalize(item, case_insensitive) for key, item in value.items()}
+
+    return value
@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache.
+
+    Entries expire after `ttl` seconds unless a ttl is given per entry. The cache holds at
+    most `max_entries` entries and `max_bytes` bytes, where the size of an entry is given
+    by the caller.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[Any, int, float]] = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, _, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self.delete(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, size: int, ttl: float | None = None) -> None:
+        self.delete(key)
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (value, size, expires_at)
+        self._size += size
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+
+    def delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
@@ -1,5 +1,66 @@
-from pydantic import BaseModel, Field
+from functools import lru_cache
+
+from pydantic import BaseModel, Field, create_model
 
 
 class BaseResponseModel(BaseModel):
     tokens_info: dict | None = Field(..., description='The tokens consumed by the user.')
+    routing: dict | None = Field(
+        None, description='The model which produced the result and why it was chosen.'
+    )
+
+
+@lru_cache(maxsize=None)
+def output_model(model: type[BaseModel]) -> type[BaseModel]:
+    """The part of a response model produced by the LLM, without the fields set by the service."""
+    fields = {
+        name: (field.annotation, field)
+        for name, field in model.model_fields.items()
+        if name not in BaseResponseModel.model_fields
+    }
+    return create_model(model.__name__, __doc__=model.__doc__, **fields)
+
+
+# Keywords OpenAI rejects in strict structured output schemas.
+STRICT_UNSUPPORTED_KEYWORDS = {
+    'default', 'format', 'pattern', 'minLength', 'maxLength', 'minimum', 'maximum',
+    'exclusiveMinimum', 'exclusiveMaximum', 'multipleOf', 'minItems', 'maxItems',
+    'uniqueItems', 'minProperties', 'maxProperties', 'patternProperties',
+}
+
+
+def strict_json_schema(model: type[BaseModel]) -> dict:
+    """
+    JSON schema of `model` as OpenAI's strict structured outputs require it: every object
+    lists all of its properties as required and allows no others, unsupported keywords are
+    dropped. Fields with defaults become required, the model fills them in anyway.
+    """
+    return _strict(model.model_json_schema())
+
+
+def _strict(schema):
+    if isinstance(schema, list):
+        return [_strict(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    strict = {}
+    for key, value in schema.items():
+        if key in STRICT_UNSUPPORTED_KEYWORDS:
+            continue
+        if key in ('properties', '$defs'):
+            # Maps names to schemas, the names themselves are not keywords.
+            strict[key] = {name: _strict(item) for name, item in value.items()}
+        else:
+            strict[key] = _strict(value)
+
+    # References take no sibling keywords such as a field's description.
+    if '$ref' in strict:
+        return {'$ref': strict['$ref']}
+    if len(strict.get('allOf', ())) == 1:
+        return strict['allOf'][0]
+
+    if strict.get('type') == 'object' and 'properties' in strict:
+        strict['required'] = list(strict['properties'])
+        strict['additionalProperties'] = False
+    return strict
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import re
+import zlib
+
+import numpy as np
+from pydantic import BaseModel
+
+from app.utils.canonical import canonicalize
+
+_TOKEN = re.compile(r'\w+')
+
+
+def _flatten_text(value) -> str:
+    if isinstance(value, dict):
+        return ' '.join(_flatten_text(item) for item in value.values())
+    if isinstance(value, list):
+        return ' '.join(_flatten_text(item) for item in value)
+    return str(value)
+
+
+def split_query(query: BaseModel, fields: tuple[str, ...]) -> tuple[str, str]:
+    """
+    Split a query into a partition key and the text used for the similarity lookup.
+
+    Only queries which agree on all fields except `fields` can match each other.
+    """
+    canonical = canonicalize(query)
+    text = ' '.join(_flatten_text(canonical.pop(field)) for field in fields if field in canonical)
+    partition = hashlib.md5(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+    return partition, text
+
+
+class HashingVectorizer:
+    """Maps texts to L2-normalized vectors of hashed word uni- and bigrams, without any fitting."""
+
+    def __init__(self, n_features: int = 2**11):
+        self.n_features = n_features
+
+    def transform(self, text: str) -> np.ndarray:
+        tokens = _TOKEN.findall(text.casefold())
+        features = tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        for feature in features:
+            h = zlib.crc32(feature.encode())
+            vector[h % self.n_features] += 1.0 if h & 0x80000000 else -1.0
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SimilarityIndex:
+    """
+    Bounded cosine similarity index mapping texts to cache keys.
+
+    Vectors are kept in a fixed size ring buffer, so the oldest entries are evicted first.
+    """
+
+    def __init__(self, max_entries: int, vectorizer: HashingVectorizer | None = None):
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self.max_entries = max_entries
+        self._vectors = np.zeros((max_entries, self.vectorizer.n_features), dtype=np.float32)
+        self._partitions: list[str | None] = [None] * max_entries
+        self._keys: list[str | None] = [None] * max_entries
+        self._slots: dict[str, int] = {}
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, cache_key: str) -> bool:
+        return cache_key in self._slots
+
+    def add(self, partition: str, text: str, cache_key: str) -> None:
+        if cache_key in self._slots:
+            return
+
+        slot = self._next
+        self._next = (self._next + 1) % self.max_entries
+        evicted = self._keys[slot]
+        if evicted is not None:
+            del self._slots[evicted]
+
+        self._vectors[slot] = self.vectorizer.transform(text)
+        self._partitions[slot] = partition
+        self._keys[slot] = cache_key
+        self._slots[cache_key] = slot
+
+    def remove(self, cache_key: str) -> None:
+        slot = self._slots.pop(cache_key, None)
+        if slot is not None:
+            self._vectors[slot] = 0.0
+            self._partitions[slot] = None
+            self._keys[slot] = None
+
+    def find(self, partition: str, text: str, threshold: float) -> tuple[str, float] | None:
+        """Return the most similar cache key within `partition` if it reaches `threshold`."""
+        if not self._slots:
+            return None
+
+        scores = self._vectors @ self.vectorizer.transform(text)
+        mask = np.fromiter(
+            (p == partition for p in self._partitions), dtype=bool, count=self.max_entries
+        )
+        scores = np.where(mask, scores, -1.0)
+
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        return self._keys[best], float(scores[best])
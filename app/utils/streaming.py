@@ -0,0 +1,17 @@
+import json
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+SSE_MEDIA_TYPE = 'text/event-stream'
+
+
+def wants_sse(accept: str | None) -> bool:
+    """Whether the client asked for Server-Sent Events rather than NDJSON."""
+    return SSE_MEDIA_TYPE in (accept or '')
+
+
+def encode_event(event: dict, sse: bool = False) -> str:
+    """Encode an event with an `event` name as an NDJSON line or a Server-Sent Event."""
+    data = json.dumps(event, default=str)
+    if sse:
+        return f'event: {event["event"]}\ndata: {data}\n\n'
+    return f'{data}\n'
@@ -1,8 +1,11 @@
 #!/usr/bin/env python
+import asyncio
 import importlib
 import inspect
+import json
 import pkgutil
 import subprocess  # nosec
+import time
 from pathlib import Path
 
 import typer
@@ -50,6 +53,82 @@ def lint():
     subprocess.run(['isort', '.'])
 
 
+@cmd.command(name='bench')
+def bench(
+    path: str = typer.Argument('/health-check', help='path to request'),
+    requests: int = typer.Option(2000, '--requests', '-n', help='number of requests'),
+    concurrency: int = typer.Option(50, '--concurrency', '-c', help='concurrent requests'),
+    body: str = typer.Option(None, '--json', help='JSON body, sends a POST request'),
+    cookie: str = typer.Option(None, '--auth', help='value of the auth cookie'),
+):
+    """Measure in-process throughput of a route, including the middleware stack"""
+    import httpx
+
+    from app.main import app
+
+    payload = json.loads(body) if body else None
+    cookies = {'auth': cookie} if cookie else None
+
+    async def run() -> tuple[float, dict[int, int]]:
+        statuses: dict[int, int] = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url='http://bench', cookies=cookies
+        ) as client:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def request():
+                async with semaphore:
+                    if payload is None:
+                        response = await client.get(path)
+                    else:
+                        response = await client.post(path, json=payload)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(request() for _ in range(requests)))
+            return time.perf_counter() - start, statuses
+
+    elapsed, statuses = asyncio.run(run())
+    print(f'{requests} requests in {elapsed:.2f}s: {requests / elapsed:.0f} req/s')
+    print(f'status codes: {statuses}')
+
+
+@cmd.command(name='worker')
+def worker(
+    concurrency: int = typer.Option(
+        settings.JOB_CONCURRENCY, '--concurrency', '-c', help='jobs run in parallel'
+    ),
+):
+    """Run a job worker without the web server"""
+    from app.auth.usage import usage_reporter
+    from app.core.http import close_dataservice_client, close_llm_clients
+    from app.core.prompt_registry import prompt_registry
+    from app.core.redis import close_redis, init_redis
+    from app.core.service_registry import service_registry
+    from app.jobs.worker import JobWorker
+    from app.router import services
+
+    async def run():
+        prompt_registry.preload([service.prompt_name for service in services])
+        service_registry.startup()
+        await init_redis()
+        if settings.USAGE_WRITE_BEHIND_ENABLED:
+            usage_reporter.start()
+        try:
+            await JobWorker(concurrency=concurrency).serve()
+        finally:
+            await usage_reporter.stop()
+            await close_llm_clients()
+            await close_dataservice_client()
+            await close_redis()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
 @cmd.command(name='list-prompts')
 def list_prompts():
     """List all prompt names from services"""
@@ -0,0 +1,111 @@
+from typing import Callable
+
+ScriptHandler = Callable[['FakeRedis', list, list], object]
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the asyncio Redis client, covering the commands used by the
+    cache and the usage queue. Expirations are recorded in `ttls` but not enforced; Lua
+    scripts are run by the Python handlers passed in `scripts`.
+    """
+
+    def __init__(self, scripts: dict[str, ScriptHandler] | None = None):
+        self.data: dict[str, object] = {}
+        self.ttls: dict[str, int | None] = {}
+        self.scripts = scripts or {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, *keys):
+        if len(keys) == 1 and isinstance(keys[0], list):
+            keys = keys[0]
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        self.ttls[key] = ex
+        return True
+
+    async def exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def expire(self, key, seconds):
+        self.ttls[key] = seconds
+        return key in self.data
+
+    def _list(self, key) -> list:
+        return self.data.setdefault(key, [])
+
+    async def rpush(self, key, *values):
+        self._list(key).extend(values)
+        return len(self.data[key])
+
+    async def lpush(self, key, *values):
+        for value in values:
+            self._list(key).insert(0, value)
+        return len(self.data[key])
+
+    async def lrange(self, key, start, stop):
+        values = self.data.get(key, [])
+        return values[start:] if stop == -1 else values[start:stop + 1]
+
+    async def llen(self, key):
+        return len(self.data.get(key, []))
+
+    async def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+
+    async def srem(self, key, *members):
+        self.data.get(key, set()).difference_update(members)
+
+    async def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    async def eval(self, script, numkeys, *args):
+        handler = self.scripts[script]
+        return handler(self, list(args[:numkeys]), list(args[numkeys:]))
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        results = [
+            await getattr(self.redis, name)(*args, **kwargs)
+            for name, args, kwargs in self.commands
+        ]
+        self.commands = []
+        return results
+
+
+def release_lock(redis: FakeRedis, keys: list, args: list) -> int:
+    """Handler for the compare-and-delete lock release scripts."""
+    if redis.data.get(keys[0]) == args[0]:
+        del redis.data[keys[0]]
+        return 1
+    return 0
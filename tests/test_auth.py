@@ -0,0 +1,268 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from app.auth.auth import token_cache, verify_token
+from app.auth.quota import CONSUME_SCRIPT, QuotaLedger
+from app.auth.schemas import TokenQuotaResponse
+from app.auth.service import AuthService
+from app.auth.usage import MOVE_SCRIPT, UsageReporter
+from app.core.config import settings
+from tests.fake_redis import FakeRedis
+
+
+def create_token(expires_in: int) -> str:
+    payload = {
+        'sub': 'user-1',
+        'aud': settings.AUTH_TOKEN_AUDIENCE,
+        'exp': int(time.time()) + expires_in,
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.AUTH_TOKEN_ALGORITHM)
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+def test_verify_token_caches_verified_payload():
+    token = create_token(expires_in=3600)
+    assert verify_token(token)['sub'] == 'user-1'
+
+    with patch('app.auth.auth.jwt.decode') as mock_decode:
+        assert verify_token(token)['sub'] == 'user-1'
+        mock_decode.assert_not_called()
+
+
+def test_verify_token_rejects_invalid_token():
+    with pytest.raises(HTTPException) as exc_info:
+        verify_token('not-a-token')
+    assert exc_info.value.status_code == 401
+    assert len(token_cache) == 0
+
+
+def test_deferred_usage_is_sent_with_the_service_credential():
+    payload = {'consumed_tokens': 10, 'total_cost': 0.1, 'prompt_name': 'p', 'model_name': 'm'}
+    client = AsyncMock()
+    client.post.return_value = httpx.Response(201)
+    with (
+        patch('app.auth.usage.get_dataservice_client', return_value=client),
+        patch.object(settings, 'DATASERVICE_API_KEY', 'service-key'),
+    ):
+        assert asyncio.run(UsageReporter().send(None, 'user-1', payload)) == 201
+
+    path = client.post.call_args.args[0]
+    assert path == UsageReporter.service_endpoint
+    assert client.post.call_args.kwargs['json'] == {'user_id': 'user-1', **payload}
+    assert client.post.call_args.kwargs['headers'] == {'Authorization': 'Bearer service-key'}
+
+
+def test_deferred_usage_is_not_sent_without_a_service_credential():
+    payload = {'consumed_tokens': 10, 'total_cost': 0.1, 'prompt_name': 'p', 'model_name': 'm'}
+    client = AsyncMock()
+    with (
+        patch('app.auth.usage.get_dataservice_client', return_value=client),
+        patch.object(settings, 'DATASERVICE_API_KEY', None),
+    ):
+        assert asyncio.run(UsageReporter().send(None, 'user-1', payload)) is None
+    client.post.assert_not_called()
+
+
+def test_usage_queue_holds_no_credentials():
+    redis = FakeRedis()
+    payload = {'consumed_tokens': 10, 'total_cost': 0.1, 'prompt_name': 'p', 'model_name': 'm'}
+    with patch('app.auth.usage.get_redis', return_value=redis):
+        asyncio.run(UsageReporter().record('user-token', 'user-1', payload))
+
+    entry = json.loads(redis.data[UsageReporter.queue_key][0])
+    assert entry == {'user_id': 'user-1', **payload}
+
+
+def move_entries(redis, keys, args):
+    """Handler for the usage reporter's MOVE_SCRIPT."""
+    source = redis.data.get(keys[0], [])
+    count = int(args[0]) or len(source)
+    entries = source[:count]
+    del source[:count]
+    redis.data.setdefault(keys[1], []).extend(entries)
+    return entries
+
+
+def queue_usage(redis, user_id: str, consumed_tokens: int, **extra):
+    entry = {
+        'user_id': user_id,
+        'consumed_tokens': consumed_tokens,
+        'total_cost': 0.1,
+        'prompt_name': 'p',
+        'model_name': 'm',
+        **extra,
+    }
+    redis.data.setdefault(UsageReporter.queue_key, []).append(json.dumps(entry))
+
+
+def test_usage_flush_aggregates_and_requeues_or_dead_letters_failures():
+    redis = FakeRedis(scripts={MOVE_SCRIPT: move_entries})
+    queue_usage(redis, 'user-1', 10)
+    queue_usage(redis, 'user-1', 20)
+    queue_usage(redis, 'user-2', 5)
+    queue_usage(redis, 'user-3', 7)
+    status_codes = {'user-1': 201, 'user-2': 401, 'user-3': 422}
+    reporter = UsageReporter(max_attempts=3)
+
+    async def send(auth_token, user_id, payload):
+        return status_codes[user_id]
+
+    with (
+        patch('app.auth.usage.get_redis', return_value=redis),
+        patch.object(reporter, 'send', AsyncMock(side_effect=send)) as mock_send,
+    ):
+        assert asyncio.run(reporter.flush()) == 4
+
+    payloads = {call.args[1]: call.args[2] for call in mock_send.call_args_list}
+    assert all(call.args[0] is None for call in mock_send.call_args_list)
+    assert payloads['user-1']['consumed_tokens'] == 30
+    assert redis.data.get(reporter._processing_key(reporter.flusher_id)) is None
+
+    retried = [json.loads(entry) for entry in redis.data[reporter.queue_key]]
+    assert [(r['user_id'], r['attempts'], r['status_code']) for r in retried] == [
+        ('user-2', 1, 401)
+    ]
+    dead = [json.loads(entry) for entry in redis.data[reporter.dead_letter_key]]
+    assert [(r['user_id'], r['status_code']) for r in dead] == [('user-3', 422)]
+
+
+def test_usage_flush_dead_letters_after_max_attempts():
+    redis = FakeRedis(scripts={MOVE_SCRIPT: move_entries})
+    queue_usage(redis, 'user-1', 10, attempts=2)
+    reporter = UsageReporter(max_attempts=3)
+
+    with (
+        patch('app.auth.usage.get_redis', return_value=redis),
+        patch.object(reporter, 'send', AsyncMock(side_effect=httpx.ConnectError('down'))),
+    ):
+        asyncio.run(reporter.flush())
+
+    assert redis.data[reporter.queue_key] == []
+    dead = json.loads(redis.data[reporter.dead_letter_key][0])
+    assert dead['attempts'] == 3
+    assert dead['status_code'] is None
+
+
+def test_usage_flush_recovers_batches_of_expired_flushers():
+    redis = FakeRedis(scripts={MOVE_SCRIPT: move_entries})
+    crashed = UsageReporter()
+    queue_usage(redis, 'user-1', 10)
+    asyncio.run(redis.sadd(UsageReporter.flushers_key, crashed.flusher_id, 'alive'))
+    asyncio.run(redis.set(crashed._lease_key('alive'), 1))
+    redis.data[crashed._processing_key(crashed.flusher_id)] = redis.data.pop(crashed.queue_key)
+    redis.data[crashed._processing_key('alive')] = ['in flight']
+
+    reporter = UsageReporter()
+    with (
+        patch('app.auth.usage.get_redis', return_value=redis),
+        patch.object(reporter, 'send', AsyncMock(return_value=201)) as mock_send,
+    ):
+        assert asyncio.run(reporter.flush()) == 1
+
+    mock_send.assert_awaited_once()
+    assert redis.data[crashed._processing_key('alive')] == ['in flight']
+    assert redis.data[UsageReporter.flushers_key] == {'alive', reporter.flusher_id}
+
+
+def test_usage_reporter_stop_flushes_the_queue_and_releases_its_lease():
+    redis = FakeRedis(scripts={MOVE_SCRIPT: move_entries})
+    for i in range(5):
+        queue_usage(redis, f'user-{i}', 10)
+    reporter = UsageReporter(batch_size=2)
+
+    with (
+        patch('app.auth.usage.get_redis', return_value=redis),
+        patch.object(reporter, 'send', AsyncMock(return_value=201)) as mock_send,
+    ):
+        asyncio.run(reporter.stop())
+
+    assert mock_send.await_count == 5
+    assert redis.data[reporter.queue_key] == []
+    assert reporter.flusher_id not in redis.data[reporter.flushers_key]
+    assert reporter._lease_key(reporter.flusher_id) not in redis.data
+
+
+def consume_quota(redis, keys, args):
+    """Handler for the quota ledger's CONSUME_SCRIPT."""
+    if keys[0] not in redis.data:
+        return None
+    redis.data[keys[0]] = str(int(redis.data[keys[0]]) - int(args[0]))
+    return int(redis.data[keys[0]])
+
+
+def make_quota(remaining_tokens: int) -> TokenQuotaResponse:
+    return TokenQuotaResponse(
+        sufficient=remaining_tokens > 0,
+        token_limit=100_000,
+        consumed_tokens=100_000 - remaining_tokens,
+        remaining_tokens=remaining_tokens,
+    )
+
+
+def test_quota_ledger_is_seeded_with_its_ttl_and_consumed():
+    redis = FakeRedis(scripts={CONSUME_SCRIPT: consume_quota})
+    ledger = QuotaLedger(ttl=300, margin=1000)
+
+    with patch('app.auth.quota.get_redis', return_value=redis):
+        # Without an estimate, the data-service has to be asked.
+        assert not asyncio.run(ledger.has_headroom('user-1'))
+        asyncio.run(ledger.consume('user-1', 100))
+        assert ledger._key('user-1') not in redis.data
+
+        asyncio.run(ledger.seed('user-1', 5000))
+        assert redis.ttls[ledger._key('user-1')] == 300
+        assert asyncio.run(ledger.has_headroom('user-1'))
+
+        asyncio.run(ledger.consume('user-1', 3000))
+        assert redis.data[ledger._key('user-1')] == '2000'
+
+
+def test_quota_ledger_has_no_headroom_at_the_margin():
+    redis = FakeRedis(scripts={CONSUME_SCRIPT: consume_quota})
+    ledger = QuotaLedger(ttl=300, margin=1000)
+
+    with patch('app.auth.quota.get_redis', return_value=redis):
+        asyncio.run(ledger.seed('user-1', 1500))
+        asyncio.run(ledger.consume('user-1', 499))
+        assert asyncio.run(ledger.has_headroom('user-1'))
+        asyncio.run(ledger.consume('user-1', 1))
+        assert not asyncio.run(ledger.has_headroom('user-1'))
+
+
+def test_quota_check_resyncs_the_ledger_after_its_ttl_lapsed():
+    redis = FakeRedis(scripts={CONSUME_SCRIPT: consume_quota})
+    ledger = QuotaLedger(ttl=300, margin=1000)
+    request = SimpleNamespace(state=SimpleNamespace(token='user-token', user_id='user-1'))
+    service = AuthService(request, client=AsyncMock())
+
+    with (
+        patch('app.auth.quota.get_redis', return_value=redis),
+        patch('app.auth.service.quota_ledger', ledger),
+        patch.object(settings, 'QUOTA_LEDGER_ENABLED', True),
+        patch.object(
+            service, 'fetch_token_quota', AsyncMock(side_effect=[make_quota(50_000), make_quota(0)])
+        ) as mock_fetch,
+    ):
+        assert asyncio.run(service.check_token_quota())
+        assert asyncio.run(service.check_token_quota())
+        assert mock_fetch.await_count == 1
+
+        # The entry expires; FakeRedis records the TTL but does not enforce it.
+        del redis.data[ledger._key('user-1')]
+        assert not asyncio.run(service.check_token_quota())
+        assert mock_fetch.await_count == 2
+        assert redis.data[ledger._key('user-1')] == '0'
@@ -1,3 +1,5 @@
+from unittest.mock import AsyncMock, patch
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -42,3 +44,20 @@ def test_smith_connection_successful():
     response = client.get('/health-check/smith/check-connection')
     assert response.status_code == 200
     assert response.json() == {'message': 'Smith connection successful'}
+
+
+def test_smith_connection_check_does_not_block_the_event_loop():
+    with (
+        patch(
+            'app.core.health_checks.prompt_registry.aget_template',
+            AsyncMock(return_value='Answer: yes'),
+        ) as mock_template,
+        patch('app.core.health_checks.ChatOpenAI.ainvoke', AsyncMock(return_value='yes')),
+        patch('app.core.health_checks.ChatOpenAI.invoke') as mock_invoke,
+    ):
+        response = client.get('/health-check/smith/check-connection')
+
+    assert response.status_code == 200
+    assert response.json() == {'message': 'Smith connection successful'}
+    mock_template.assert_awaited_once_with('health-check')
+    mock_invoke.assert_not_called()
@@ -0,0 +1,72 @@
+import asyncio
+from unittest.mock import patch
+
+from app.core.service_registry import service_registry
+from app.jobs.worker import JobWorker
+from app.project.schemas import BaseProjectRequest, ProjectSummaryResponse
+from app.project.service import ProjectSummaryService
+
+
+class InMemoryQueue:
+    def __init__(self):
+        self.jobs = {}
+        self.requeued = []
+
+    async def update(self, job):
+        self.jobs[job['id']] = dict(job)
+
+    async def requeue(self, job):
+        self.requeued.append(job['id'])
+
+
+def make_job(service='ProjectSummaryService'):
+    query = BaseProjectRequest(name='H2 Project', context='Building a H2 cavern.')
+    return {
+        'id': 'job-1',
+        'service': service,
+        'status': 'queued',
+        'query': query.model_dump(),
+        'user_id': 'user-1',
+        'created_at': 0.0,
+    }
+
+
+def test_job_worker_runs_service_and_bills_usage():
+    service_registry.register(ProjectSummaryService)
+    result = ProjectSummaryResponse(
+        summary='A H2 project.',
+        image_url='https://example.com/h2.png',
+        tags=['H2'],
+        tokens_info={
+            'consumed_tokens': 10, 'total_cost': 0.1, 'prompt_name': 'p', 'model_name': 'm'
+        },
+    )
+    queue = InMemoryQueue()
+
+    with (
+        patch(
+            'app.project.service.ProjectSummaryService.execute_query', return_value=result
+        ) as mock_execute,
+        patch('app.jobs.worker.usage_reporter.record') as mock_record,
+        patch('app.jobs.worker.quota_ledger.consume'),
+    ):
+        asyncio.run(JobWorker(queue=queue).process(make_job()))
+
+    job = queue.jobs['job-1']
+    assert job['status'] == 'done'
+    assert job['result']['summary'] == 'A H2 project.'
+    assert job['result']['tokens_info'] is None
+    assert mock_execute.call_args.kwargs == {'use_deadline': False}
+    mock_record.assert_awaited_once()
+    assert mock_record.call_args.args[0] is None
+    assert mock_record.call_args.args[2]['consumed_tokens'] == 10
+
+
+def test_job_worker_marks_unknown_service_as_failed_without_details():
+    queue = InMemoryQueue()
+    asyncio.run(JobWorker(queue=queue).process(make_job(service='UnknownService')))
+
+    job = queue.jobs['job-1']
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Internal Server Error'
+    assert job['finished_at']
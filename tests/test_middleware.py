@@ -0,0 +1,94 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import jwt
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.testclient import TestClient
+
+from app.auth.auth import token_cache
+from app.core.config import settings
+from app.middleware.custom_error_format import CustomErrorFormatMiddleware
+from app.middleware.token_extraction import TokenExtractionMiddleware
+
+
+def create_token(user_id: str) -> str:
+    payload = {
+        'sub': user_id,
+        'aud': settings.AUTH_TOKEN_AUDIENCE,
+        'exp': int(time.time()) + 3600,
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.AUTH_TOKEN_ALGORITHM)
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/state')
+    async def state(request: Request):
+        return {'token': request.state.token, 'user_id': request.state.user_id}
+
+    app.add_middleware(CustomErrorFormatMiddleware)
+    app.add_middleware(TokenExtractionMiddleware)
+    return app
+
+
+def test_token_extraction_sets_token_and_user_id():
+    token_cache.clear()
+    token = create_token('user-1')
+    client = TestClient(make_app())
+
+    with patch('app.auth.auth.is_token_revoked', AsyncMock(return_value=False)):
+        response = client.get('/state', cookies={'auth': token})
+    assert response.json() == {'token': token, 'user_id': 'user-1'}
+
+    client.cookies.clear()
+    assert client.get('/state').json() == {'token': None, 'user_id': None}
+    response = client.get('/state', cookies={'auth': 'not-a-token'})
+    assert response.json() == {'token': None, 'user_id': None}
+
+
+def test_validation_errors_are_reformatted():
+    async def app(scope, receive, send):
+        raise RequestValidationError(
+            [{'type': 'missing', 'loc': ('body', 'name'), 'msg': 'Field required'}]
+        )
+
+    response = TestClient(CustomErrorFormatMiddleware(app)).get('/')
+
+    assert response.status_code == 422
+    assert response.json() == {
+        'detail': 'Validation failed',
+        'errors': [{'type': 'missing', 'loc': ['body', 'name'], 'msg': 'Field required'}],
+    }
+
+
+def test_streaming_responses_pass_through_unbuffered():
+    release = asyncio.Event()
+    messages = []
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'first', 'more_body': True})
+        await release.wait()
+        await send({'type': 'http.response.body', 'body': b'last', 'more_body': False})
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        stack = CustomErrorFormatMiddleware(TokenExtractionMiddleware(app))
+        scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': []}
+        task = asyncio.create_task(stack(scope, receive, send))
+        await asyncio.sleep(0.01)
+        # The first chunk reached the server while the app is still producing the body.
+        assert [m.get('body') for m in messages] == [None, b'first']
+        release.set()
+        await task
+
+    asyncio.run(run())
+    assert [m.get('body') for m in messages] == [None, b'first', b'last']
@@ -1,13 +1,20 @@
+import asyncio
 import json
-from unittest.mock import patch
+import time
+from unittest.mock import AsyncMock, patch
 
+import jwt
 import pytest
 from fastapi.testclient import TestClient
 
+from app.core.config import settings
+from app.core.registrar import BaseServiceHandler
+from app.core.service_registry import service_registry
 from app.main import app
 from app.project.schemas import (BaseProjectRequest,
                                  CheckProjectContextResponse,
                                  ProjectSummaryResponse)
+from app.project.service import ProjectSummaryService
 
 client = TestClient(app)
 
@@ -77,3 +84,95 @@ def test_live_summarize_project_valid_input(project_request_data):
     response = client.post('/api/project/summarize/', json=project_request_data)
     assert response.status_code == 200
     print(json.dumps(response.json(), indent=4))
+
+
+def test_project_summary_stream_events(project_request_data):
+    result = ProjectSummaryResponse(
+        summary='A H2 project.',
+        image_url='https://example.com/h2.png',
+        tags=['H2'],
+        tokens_info={
+            'consumed_tokens': 10, 'total_cost': 0.1, 'prompt_name': 'p', 'model_name': 'm'
+        },
+    )
+
+    async def stream_query(query):
+        yield {'summary': 'A H2'}
+        yield {'summary': 'A H2 project.'}
+        yield result
+
+    handler = BaseServiceHandler(
+        lambda: service_registry.get(ProjectSummaryService),
+        BaseProjectRequest,
+        ProjectSummaryResponse,
+    )
+    on_result = AsyncMock()
+
+    async def collect():
+        request = BaseProjectRequest(**project_request_data)
+        return [event async for event in handler.stream(request, on_result)]
+
+    with patch.object(ProjectSummaryService, 'stream_query', side_effect=stream_query):
+        events = asyncio.run(collect())
+
+    assert [event['event'] for event in events] == ['partial', 'partial', 'result']
+    assert events[1]['data'] == {'summary': 'A H2 project.'}
+    assert events[2]['data']['tags'] == ['H2']
+    on_result.assert_awaited_once()
+
+
+def authenticated_client() -> TestClient:
+    token = jwt.encode(
+        {'sub': 'user-1', 'aud': settings.AUTH_TOKEN_AUDIENCE, 'exp': int(time.time()) + 3600},
+        settings.SECRET_KEY,
+        algorithm=settings.AUTH_TOKEN_ALGORITHM,
+    )
+    return TestClient(app, cookies={'auth': token})
+
+
+def make_summary_response(**tokens_info) -> ProjectSummaryResponse:
+    return ProjectSummaryResponse(
+        summary='A H2 project.',
+        image_url='https://example.com/h2.png',
+        tags=['H2'],
+        tokens_info={
+            'consumed_tokens': 10,
+            'total_cost': 0.1,
+            'prompt_name': 'p',
+            'model_name': 'm',
+            **tokens_info,
+        },
+    )
+
+
+def test_cached_result_skips_quota_and_billing(project_request_data):
+    cached = make_summary_response(consumed_tokens=0, cache_hit=True, saved_tokens=10)
+
+    with (
+        patch.object(ProjectSummaryService, 'get_cached_result', return_value=cached),
+        patch.object(ProjectSummaryService, 'execute_query') as mock_execute_query,
+        patch('app.core.registrar.AuthService.check_token_quota', return_value=False),
+        patch('app.core.registrar.AuthService.consume_tokens') as mock_consume_tokens,
+    ):
+        response = authenticated_client().post('/api/project/summarize/', json=project_request_data)
+
+    assert response.status_code == 200
+    assert response.json()['summary'] == 'A H2 project.'
+    mock_execute_query.assert_not_called()
+    mock_consume_tokens.assert_not_called()
+
+
+def test_cache_miss_is_computed_without_a_second_lookup(project_request_data):
+    with (
+        patch.object(ProjectSummaryService, 'get_cached_result', return_value=None),
+        patch.object(
+            ProjectSummaryService, 'execute_query', return_value=make_summary_response()
+        ) as mock_execute_query,
+        patch('app.core.registrar.AuthService.check_token_quota', return_value=True),
+        patch('app.core.registrar.AuthService.consume_tokens') as mock_consume_tokens,
+    ):
+        response = authenticated_client().post('/api/project/summarize/', json=project_request_data)
+
+    assert response.status_code == 200
+    assert mock_execute_query.call_args.kwargs == {'lookup': False}
+    mock_consume_tokens.assert_awaited_once()
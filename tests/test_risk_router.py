@@ -1,17 +1,26 @@
+import asyncio
 import json
 from unittest.mock import patch
 
 import pytest
 from fastapi.testclient import TestClient
-from risk.schemas import (RiskDriversResponse, RiskImpactResponse,
-                          RiskLikelihoodResponse, RiskMitigationResponse)
+from pydantic import ValidationError
 
-from app.category.schemas import Category
+from app.category.schemas import CategoriesResponse, Category, IdentifiedCategory
+from app.core.config import settings
+from app.core.service_registry import service_registry
 from app.main import app
 from app.project.schemas import BaseProjectRequest
-from app.risk.schemas import (Risk, RiskDefinitionCheckResponse,
-                              RiskDriversRequest, RiskIdentificationRequest,
-                              RiskIdentificationResponse)
+from app.risk.batch import RiskAssessmentBatch
+from app.risk.pipeline import RiskRegisterPipeline
+from app.risk.schemas import (Risk, RiskAssessmentBatchRequest,
+                              RiskAssessmentRequest, RiskAssessmentResponse,
+                              RiskDefinitionCheckResponse, RiskDriversRequest,
+                              RiskDriversResponse, RiskIdentificationRequest,
+                              RiskIdentificationResponse, RiskImpactResponse,
+                              RiskLikelihoodResponse, RiskMitigationResponse,
+                              RiskRegisterRequest)
+from app.risk.service import RiskAssessmentService, RiskDriverService
 
 client = TestClient(app)
 
@@ -251,3 +260,201 @@ def test_live_risk_mitigation(project_request_data):
     response_data = response.json()
     print(json.dumps(response_data, indent=2))
     assert isinstance(RiskMitigationResponse(**response_data), RiskMitigationResponse)
+
+
+def test_risk_assessment_batch_runs_only_cache_misses(project_request_data):
+    risks = [Risk(title=f'Risk {i}', description=f'Description {i}') for i in range(3)]
+    request = RiskAssessmentBatchRequest(
+        **project_request_data, risks=risks, assessments=['likelihood', 'impact']
+    )
+    tokens_info = {'consumed_tokens': 10, 'total_cost': 0.1, 'prompt_name': 'p', 'model_name': 'm'}
+    cached = RiskImpactResponse(
+        impacts=['cost'], level='low', explanation='', sources=[],
+        tokens_info={**tokens_info, 'consumed_tokens': 0, 'cache_hit': True},
+    )
+    likelihood = RiskLikelihoodResponse(
+        likelihood='high', explanation='', sources=[], tokens_info=tokens_info
+    )
+    impact = cached.model_copy(update={'tokens_info': tokens_info})
+
+    with (
+        patch(
+            'app.risk.batch.get_cached_results',
+            return_value=[None, cached.model_copy(deep=True)] * 3,
+        ),
+        patch(
+            'app.risk.service.RiskLikelihoodService.execute_query',
+            side_effect=lambda query, **kwargs: likelihood.model_copy(deep=True),
+        ) as mock_likelihood,
+        patch('app.risk.service.RiskImpactService.execute_query', return_value=impact),
+    ):
+        batch = RiskAssessmentBatch(request)
+        asyncio.run(batch.lookup())
+        assert batch.misses == 3
+        response = asyncio.run(batch.run(max_concurrency=2))
+
+    assert mock_likelihood.call_count == 3
+    assert all(call.kwargs == {'lookup': False} for call in mock_likelihood.call_args_list)
+    assert [result.risk for result in response.results] == risks
+    assert all(result.impact.level == 'low' for result in response.results)
+    assert all(result.drivers is None for result in response.results)
+    assert response.tokens_info['consumed_tokens'] == 30
+    assert response.tokens_info['prompt_name'] == RiskAssessmentBatch.prompt_name
+
+
+def test_risk_assessment_batch_is_capped_and_hides_error_details(project_request_data):
+    risks = [Risk(title=f'Risk {i}', description='') for i in range(settings.BATCH_MAX_RISKS + 1)]
+    with pytest.raises(ValidationError):
+        RiskAssessmentBatchRequest(**project_request_data, risks=risks)
+
+    request = RiskAssessmentBatchRequest(
+        **project_request_data, risks=risks[:1], assessments=['likelihood']
+    )
+    with (
+        patch('app.risk.batch.get_cached_results', return_value=[None]),
+        patch(
+            'app.risk.service.RiskLikelihoodService.execute_query',
+            side_effect=RuntimeError('Connection to redis://internal:6379 refused'),
+        ),
+    ):
+        batch = RiskAssessmentBatch(request)
+        asyncio.run(batch.lookup())
+        response = asyncio.run(batch.run(max_concurrency=2))
+
+    assert response.results[0].errors == {'likelihood': 'Internal Server Error'}
+
+
+def test_risk_register_pipeline_streams_all_stages(project_request_data):
+    tokens_info = {'consumed_tokens': 10, 'total_cost': 0.1, 'prompt_name': 'p', 'model_name': 'm'}
+    categories = CategoriesResponse(
+        categories=[
+            IdentifiedCategory(name=f'Category {i}', description='', confidence=1.0)
+            for i in range(2)
+        ],
+        tokens_info=tokens_info,
+    )
+    risks = RiskIdentificationResponse(
+        risks=[Risk(title='Risk', description='Description')], tokens_info=tokens_info
+    )
+    drivers = RiskDriversResponse(
+        drivers=['weather'], explanation='', sources=[], tokens_info=tokens_info
+    )
+    mitigation = RiskMitigationResponse(
+        mitigation='plan', explanation='', sources=[], tokens_info=tokens_info
+    )
+    request = RiskRegisterRequest(**project_request_data, assessments=['drivers', 'mitigation'])
+
+    async def collect():
+        pipeline = RiskRegisterPipeline(request, max_concurrency=2)
+        return [event async for event in pipeline.stream()], pipeline
+
+    with (
+        patch('app.category.service.CreateRiskCategoriesService.execute_query',
+              side_effect=lambda query: categories.model_copy(deep=True)),
+        patch('app.risk.service.RiskIdentificationService.execute_query',
+              side_effect=lambda query: risks.model_copy(deep=True)),
+        patch('app.risk.service.RiskDriverService.execute_query',
+              side_effect=lambda query: drivers.model_copy(deep=True)),
+        patch('app.risk.service.RiskMitigationService.execute_query',
+              side_effect=lambda query: mitigation.model_copy(deep=True)) as mock_mitigation,
+    ):
+        events, pipeline = asyncio.run(collect())
+
+    names = [event['event'] for event in events]
+    assert names[0] == 'categories'
+    assert names[-1] == 'done'
+    assert names.count('risks') == 2
+    assert names.count('drivers') == 2
+    assert names.count('mitigation') == 2
+    assert mock_mitigation.call_args.args[0].drivers == ['weather']
+    assert 'tokens_info' not in events[0]['data']
+    assert pipeline.tokens_info['consumed_tokens'] == 70
+
+
+def test_risk_register_pipeline_caps_fan_out_and_hides_error_details(project_request_data):
+    tokens_info = {'consumed_tokens': 10, 'total_cost': 0.1, 'prompt_name': 'p', 'model_name': 'm'}
+    categories = CategoriesResponse(
+        categories=[
+            IdentifiedCategory(name=f'Category {i}', description='', confidence=1.0)
+            for i in range(3)
+        ],
+        tokens_info=tokens_info,
+    )
+    risks = RiskIdentificationResponse(
+        risks=[Risk(title=f'Risk {i}', description='') for i in range(3)],
+        tokens_info=tokens_info,
+    )
+    request = RiskRegisterRequest(**project_request_data, assessments=['likelihood'])
+    error = RuntimeError('Connection to redis://internal:6379 refused')
+
+    async def collect():
+        pipeline = RiskRegisterPipeline(request, max_concurrency=2, max_categories=2, max_risks=4)
+        return [event async for event in pipeline.stream()]
+
+    with (
+        patch('app.category.service.CreateRiskCategoriesService.execute_query',
+              side_effect=lambda query: categories.model_copy(deep=True)),
+        patch('app.risk.service.RiskIdentificationService.execute_query',
+              side_effect=lambda query: risks.model_copy(deep=True)) as mock_identify,
+        patch('app.risk.service.RiskLikelihoodService.execute_query',
+              side_effect=error) as mock_likelihood,
+    ):
+        events = asyncio.run(collect())
+
+    assert mock_identify.call_count == 2
+    assert mock_likelihood.call_count == 4
+    errors = [event for event in events if event['event'] == 'error']
+    assert {error['stage'] for error in errors} == {'risks', 'assessments', 'likelihood'}
+    assert all(
+        error['detail'] == 'Internal Server Error'
+        for error in errors if error['stage'] == 'likelihood'
+    )
+
+
+def make_risk_assessment(model_name: str) -> RiskAssessmentResponse:
+    return RiskAssessmentResponse(
+        drivers={'drivers': ['weather'], 'explanation': '', 'sources': []},
+        likelihood={'likelihood': 'high', 'explanation': '', 'sources': []},
+        impact={'impacts': ['cost'], 'level': 'low', 'explanation': '', 'sources': []},
+        tokens_info={
+            'consumed_tokens': 30,
+            'total_cost': 0.3,
+            'prompt_name': 'p',
+            'model_name': model_name,
+        },
+        routing={'model': model_name, 'primary': settings.OPENAI_MODEL_NAME, 'escalations': []},
+    )
+
+
+def test_risk_assessment_stores_parts_for_single_services(project_request_data):
+    query = RiskAssessmentRequest(
+        **project_request_data, risk=Risk(title='Risk', description='Description')
+    )
+    service = service_registry.get(RiskAssessmentService)
+    result = make_risk_assessment(service_registry.get(RiskDriverService).model_name)
+
+    with patch('app.risk.service.store_cached_result') as mock_store:
+        asyncio.run(service.store_parts(query, result))
+
+    stored = {type(call.args[2]): call.args for call in mock_store.call_args_list}
+    assert set(stored) == {RiskDriversResponse, RiskLikelihoodResponse, RiskImpactResponse}
+    _, part_query, part = stored[RiskDriversResponse]
+    assert isinstance(part_query, RiskDriversRequest)
+    assert part_query.risk == query.risk
+    assert part.drivers == ['weather']
+    assert part.tokens_info['consumed_tokens'] == 10
+    assert part.tokens_info['prompt_name'] == 'risk-drivers'
+    assert part.tokens_info['model_name'] == result.routing['model']
+
+
+def test_risk_assessment_does_not_store_parts_of_another_model(project_request_data):
+    query = RiskAssessmentRequest(
+        **project_request_data, risk=Risk(title='Risk', description='Description')
+    )
+    service = service_registry.get(RiskAssessmentService)
+    result = make_risk_assessment('fallback-model')
+
+    with patch('app.risk.service.store_cached_result') as mock_store:
+        asyncio.run(service.store_parts(query, result))
+
+    mock_store.assert_not_called()
@@ -0,0 +1,491 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import openai
+import pytest
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+
+from app.category.schemas import (AddCategoriesRequest, CategoriesResponse,
+                                  Category)
+from app.core.config import settings
+from app.core.model_routing import ModelRoute, resolve_route
+from app.core.prompt_registry import BUNDLED_PROMPTS_DIR, PromptRegistry
+from app.core.rate_limit import RELEASE_SCRIPT, RateLimiter, RateLimitExceeded
+from app.core.resilience import LatencyTracker, hedged, with_retries
+from app.core.service_registry import service_registry
+from app.project.schemas import BaseProjectRequest, ProjectSummaryResponse
+from app.risk.schemas import (Risk, RiskAssessmentResponse,
+                              RiskDefinitionCheckResponse, RiskDriversRequest,
+                              RiskIdentificationRequest)
+from app.risk.service import (RiskAssessmentService, RiskDefinitionService,
+                              RiskDriverService, RiskIdentificationService)
+from app.utils.cache import (RELEASE_LOCK_SCRIPT, _background_tasks,
+                             get_cached_result, redis_cache,
+                             store_cached_result)
+from app.utils.canonical import canonicalize
+from app.utils.local_cache import LocalCache
+from app.utils.schema import output_model, strict_json_schema
+from app.utils.similarity import SimilarityIndex, split_query
+from app.utils.single_flight import SingleFlight
+from tests.fake_redis import FakeRedis, release_lock
+
+
+def test_local_cache_evicts_least_recently_used_entry():
+    cache = LocalCache(max_entries=2, max_bytes=1000, ttl=60)
+    cache.set('a', 1, size=10)
+    cache.set('b', 2, size=10)
+    assert cache.get('a') == 1
+
+    cache.set('c', 3, size=10)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_local_cache_respects_byte_limit():
+    cache = LocalCache(max_entries=10, max_bytes=25, ttl=60)
+    cache.set('a', 1, size=10)
+    cache.set('b', 2, size=10)
+    cache.set('c', 3, size=10)
+    assert len(cache) == 2
+    assert cache.size == 20
+    assert cache.get('a') is None
+
+    cache.set('too-large', 4, size=30)
+    assert cache.get('too-large') is None
+
+
+def test_local_cache_expires_entries():
+    cache = LocalCache(max_entries=10, max_bytes=100, ttl=5)
+    with patch('app.utils.local_cache.time.monotonic', return_value=100.0):
+        cache.set('a', 1, size=10)
+    with patch('app.utils.local_cache.time.monotonic', return_value=104.0):
+        assert cache.get('a') == 1
+    with patch('app.utils.local_cache.time.monotonic', return_value=106.0):
+        assert cache.get('a') is None
+    assert cache.size == 0
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do('key', compute) for _ in range(5))), flight
+
+    results, flight = asyncio.run(run())
+    assert calls == 1
+    assert [result for result, _ in results] == ['result'] * 5
+    assert [shared for _, shared in results].count(False) == 1
+    assert 'key' not in flight
+
+
+class SummaryService:
+    ResultModel = ProjectSummaryResponse
+    cache_timeout = None
+    cache_soft_timeout = None
+
+    def generate_cache_key(self, query):
+        return 'SummaryService:key'
+
+
+def make_summary(summary: str) -> ProjectSummaryResponse:
+    return ProjectSummaryResponse(
+        summary=summary,
+        image_url='https://example.com/h2.png',
+        tags=['H2'],
+        tokens_info={
+            'consumed_tokens': 10, 'total_cost': 0.1, 'prompt_name': 'p', 'model_name': 'm'
+        },
+    )
+
+
+def test_cache_entries_expire_after_the_default_timeout_unless_overridden():
+    redis = FakeRedis()
+    query = BaseProjectRequest(name='H2 Project', context='Building a H2 cavern.')
+    service = SummaryService()
+
+    def store():
+        return store_cached_result(
+            service, query, make_summary('old'), 123, redis_client=redis, use_local_cache=False
+        )
+
+    asyncio.run(store())
+    assert redis.ttls['SummaryService:key'] == 123
+
+    service.cache_timeout = 456
+    asyncio.run(store())
+    assert redis.ttls['SummaryService:key'] == 456
+
+
+def test_stale_cache_entry_is_served_and_refreshed_in_the_background():
+    redis = FakeRedis(scripts={RELEASE_LOCK_SCRIPT: release_lock})
+    query = BaseProjectRequest(name='H2 Project', context='Building a H2 cavern.')
+    service = SummaryService()
+    service.cache_timeout, service.cache_soft_timeout = 3600, 60
+    redis.data['SummaryService:key'] = make_summary('old').json()
+    redis.data['fresh:SummaryService:key'] = '1'
+    refresh = AsyncMock(return_value=make_summary('new'))
+
+    async def lookup():
+        result = await get_cached_result(
+            service, query, refresh=refresh, redis_client=redis, use_local_cache=False
+        )
+        await asyncio.gather(*_background_tasks)
+        return result
+
+    result = asyncio.run(lookup())
+    assert result.summary == 'old'
+    refresh.assert_not_awaited()
+
+    del redis.data['fresh:SummaryService:key']
+    result = asyncio.run(lookup())
+    assert result.summary == 'old'
+    assert result.tokens_info['cache_hit'] is True
+    refresh.assert_awaited_once()
+
+    assert ProjectSummaryResponse.parse_raw(redis.data['SummaryService:key']).summary == 'new'
+    assert redis.ttls['SummaryService:key'] == 3600
+    assert redis.ttls['fresh:SummaryService:key'] == 60
+    assert 'refresh:SummaryService:key' not in redis.data
+
+
+def test_redis_cache_skips_the_lookup_after_a_known_miss():
+    redis = FakeRedis()
+    query = BaseProjectRequest(name='H2 Project', context='Building a H2 cavern.')
+
+    class Service(SummaryService):
+        @redis_cache(redis_client=redis, use_local_cache=False)
+        async def execute_query(self, query):
+            return make_summary('computed')
+
+    redis.data['SummaryService:key'] = make_summary('cached').json()
+    service = Service()
+    assert asyncio.run(service.execute_query(query)).summary == 'cached'
+    assert asyncio.run(service.execute_query(query, lookup=False)).summary == 'computed'
+
+
+def test_canonicalize_ignores_whitespace_order_and_declared_case():
+    first = AddCategoriesRequest(
+        name='H2 Project ',
+        context='Building a  H2 cavern\n in the Netherlands.',
+        existing=[
+            Category(name='Technical', description='Technical risks.'),
+            Category(name='Financial', description='Financial risks.'),
+        ],
+        type='Risk',
+    )
+    second = AddCategoriesRequest(
+        name='H2 Project',
+        context='Building a H2 cavern in the Netherlands.',
+        existing=[
+            Category(name='Financial', description='Financial  risks.'),
+            Category(name='Technical', description='Technical risks.'),
+        ],
+        type='risk',
+    )
+    assert canonicalize(first) == canonicalize(second)
+    assert canonicalize(first)['name'] == 'H2 Project'
+
+
+def test_canonicalize_keeps_case_of_undeclared_fields():
+    first = AddCategoriesRequest(name='Alpha', context='Context', existing=[], type='risk')
+    second = AddCategoriesRequest(name='alpha', context='Context', existing=[], type='risk')
+    assert canonicalize(first) != canonicalize(second)
+
+
+def test_similarity_index_matches_near_duplicates_within_partition():
+    index = SimilarityIndex(max_entries=4)
+    index.add('risk', 'The project might face delays due to unforeseen circumstances.', 'key-1')
+    index.add('risk', 'Steel prices could rise and cause a budget overrun.', 'key-2')
+
+    match = index.find('risk', 'The project might face delays due to unforeseen events.', 0.7)
+    assert match is not None
+    assert match[0] == 'key-1'
+
+    assert index.find('other', 'The project might face delays due to unforeseen circumstances.', 0.7) is None
+    assert index.find('risk', 'A completely different sentence about hiring.', 0.7) is None
+
+
+def test_similarity_lookup_keeps_different_risks_of_a_project_apart():
+    context = ' '.join(
+        ['Construction of a geothermal power plant in a remote mountain region, including'
+         ' drilling of three production wells, a steam pipeline, a turbine hall and a grid'
+         ' connection, financed by a consortium of regional utilities.'] * 3
+    )
+    queries = [
+        RiskDriversRequest(
+            name='Geothermal', context=context, risk=Risk(title=title, description=description)
+        )
+        for title, description in [
+            ('Drilling delay', 'Hard rock slows down the drilling of the production wells.'),
+            ('Permit rejection', 'The authorities reject the water extraction permit.'),
+        ]
+    ]
+    fields = RiskDriverService.similarity_fields
+    assert 'context' not in fields
+
+    index = SimilarityIndex(max_entries=4)
+    partition, text = split_query(queries[0], fields)
+    index.add(partition, text, 'key-1')
+
+    other_partition, other_text = split_query(queries[1], fields)
+    assert other_partition == partition
+    assert index.find(other_partition, other_text, settings.SIMILARITY_CACHE_THRESHOLD) is None
+    assert index.find(partition, text, settings.SIMILARITY_CACHE_THRESHOLD)[0] == 'key-1'
+
+
+def test_risk_definition_check_does_not_match_similar_texts():
+    assert not RiskDefinitionService.similarity_fields
+
+
+def test_similarity_index_evicts_oldest_entries():
+    index = SimilarityIndex(max_entries=2)
+    for i in range(3):
+        index.add('risk', f'text number {i}', f'key-{i}')
+    assert len(index) == 2
+    assert 'key-0' not in index
+    assert 'key-2' in index
+
+
+def test_rate_limiter_waits_for_capacity_and_gives_up_after_max_wait():
+    redis = AsyncMock()
+    redis.eval.side_effect = ['0.01', '0']
+    limiter = RateLimiter(rpm=10, tpm=1000, max_wait=1.0)
+    with patch('app.core.rate_limit.get_redis', return_value=redis):
+        waited = asyncio.run(limiter.acquire('gpt-4o-mini', 100))
+        assert waited >= 0.01
+        assert redis.eval.call_count == 2
+
+        redis.eval.side_effect = ['5.0']
+        with pytest.raises(RateLimitExceeded) as exc_info:
+            asyncio.run(limiter.acquire('gpt-4o-mini', 100))
+    assert exc_info.value.retry_after == 5.0
+
+
+def release_tokens(redis, keys, args):
+    """Handler for the rate limiter's RELEASE_SCRIPT."""
+    bucket = redis.data.get(keys[0])
+    if bucket is None:
+        return None
+    bucket['tokens'] = float(bucket['tokens']) + float(args[0])
+    return bucket['tokens']
+
+
+def test_rate_limiter_release_does_not_recreate_an_expired_bucket():
+    redis = FakeRedis(scripts={RELEASE_SCRIPT: release_tokens})
+    limiter = RateLimiter(rpm=10, tpm=1000)
+    with patch('app.core.rate_limit.get_redis', return_value=redis):
+        asyncio.run(limiter.release('gpt-4o-mini', 200))
+        assert limiter._key('gpt-4o-mini') not in redis.data
+
+        redis.data[limiter._key('gpt-4o-mini')] = {'requests': 9, 'tokens': 500, 'ts': 0}
+        asyncio.run(limiter.release('gpt-4o-mini', -100))
+        assert redis.data[limiter._key('gpt-4o-mini')]['tokens'] == 400
+
+
+def test_hedged_call_returns_the_faster_attempt_and_cancels_the_other():
+    delays = [1.0, 0.01]
+    cancelled = []
+
+    async def call():
+        delay = delays.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    assert asyncio.run(hedged(call, delay=0.05, name='test')) == 0.01
+    assert cancelled == [1.0]
+
+
+def test_with_retries_retries_transient_errors_only():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) < 3:
+            raise openai.APIConnectionError(request=httpx.Request('POST', 'https://api'))
+        return 'ok'
+
+    with patch('app.core.resilience.asyncio.sleep', new=AsyncMock()):
+        assert asyncio.run(with_retries(call, retries=2, name='test')) == 'ok'
+    assert len(calls) == 3
+
+    async def fail():
+        raise ValueError('not transient')
+
+    with pytest.raises(ValueError):
+        asyncio.run(with_retries(fail, retries=2, name='test'))
+
+
+def test_latency_tracker_percentile_needs_enough_samples():
+    tracker = LatencyTracker(window=100)
+    assert tracker.percentile(0.95) is None
+    for i in range(100):
+        tracker.record(float(i))
+    assert tracker.percentile(0.95) == 95.0
+
+
+def test_model_route_escalates_on_declared_failures_only():
+    route = ModelRoute(
+        primary='small',
+        fallbacks=['large'],
+        escalate_on={'parse_error', 'input_size'},
+        max_input_tokens=100,
+    )
+    assert route.candidates(50) == (['small', 'large'], None)
+    assert route.candidates(500) == (['large'], 'input_size')
+    assert route.escalation_reason(OutputParserException('bad json')) == 'parse_error'
+    assert route.escalation_reason(TimeoutError()) is None
+    assert route.escalation_reason(ValueError()) is None
+
+
+def test_model_route_is_overridden_by_settings():
+    default = ModelRoute(primary='small')
+    with patch.object(settings, 'MODEL_ROUTES', {'SomeService': {'fallbacks': ['large']}}):
+        route = resolve_route('SomeService', default)
+        assert resolve_route('OtherService', default) is default
+    assert route.primary == 'small'
+    assert route.fallbacks == ['large']
+
+
+def test_output_model_excludes_service_fields():
+    model = output_model(RiskDefinitionCheckResponse)
+    assert 'tokens_info' not in model.model_fields
+    assert 'routing' not in model.model_fields
+    assert set(model.model_fields) == {
+        'is_valid', 'classification', 'original', 'suggestion', 'explanation'
+    }
+
+
+def test_strict_json_schema_requires_all_properties_and_no_others():
+    schema = strict_json_schema(output_model(RiskAssessmentResponse))
+    objects = [schema, *schema['$defs'].values()]
+    for item in objects:
+        assert item['additionalProperties'] is False
+        assert item['required'] == list(item['properties'])
+    assert schema['properties']['drivers'] == {'$ref': '#/$defs/RiskDriversAssessment'}
+
+    schema = strict_json_schema(output_model(CategoriesResponse))
+    category = schema['$defs']['IdentifiedCategory']
+    assert 'subcategories' in category['required']
+    assert 'default' not in category['properties']['subcategories']
+
+
+def test_structured_output_is_parsed_into_the_result_model():
+    class StructuredRiskDefinitionService(RiskDefinitionService):
+        structured_output = True
+
+    service = StructuredRiskDefinitionService()
+    assert service.response_format['json_schema']['strict'] is True
+    result = service.parse_output(
+        '{"is_valid": true, "classification": "Risk", "original": "text",'
+        ' "suggestion": "none", "explanation": "fine"}'
+    )
+    assert isinstance(result, RiskDefinitionCheckResponse)
+    assert result.is_valid is True
+    assert result.tokens_info is None
+
+    with pytest.raises(OutputParserException):
+        service.parse_output('{"is_valid": "maybe"}')
+
+
+def test_format_instructions_leave_out_the_fields_set_by_the_service():
+    service = service_registry.get(RiskDefinitionService)
+    assert 'is_valid' in service.format_instructions
+    assert 'tokens_info' not in service.format_instructions
+    assert 'routing' not in service.format_instructions
+
+    completion = (
+        '{"is_valid": true, "classification": "Risk", "original": "text",'
+        ' "suggestion": "none", "explanation": "fine"}'
+    )
+    model = FakeListChatModel(responses=[completion])
+    prompt = ChatPromptTemplate.from_template('{text}')
+    with patch.object(service, 'get_model', return_value=model):
+        result = asyncio.run(service.get_chain(prompt, 'm').ainvoke({'text': 'risk'}))
+
+    assert isinstance(result, RiskDefinitionCheckResponse)
+    assert result.classification == 'Risk'
+    assert result.tokens_info is None
+
+
+def test_prompt_registry_serves_bundled_prompts_until_the_hub_has_them(tmp_path):
+    registry = PromptRegistry(snapshot_dir=tmp_path / 'snapshots', bundled_dir=BUNDLED_PROMPTS_DIR)
+    with (
+        patch('app.core.prompt_registry.hub.pull', side_effect=ValueError('not found')),
+        patch.object(registry, '_schedule_refresh') as mock_refresh,
+    ):
+        template = registry.get_template(RiskAssessmentService.prompt_name)
+        assert '{risk}' in template
+        assert '{format_instructions}' in template
+        mock_refresh.assert_called_once_with(RiskAssessmentService.prompt_name)
+
+        with pytest.raises(ValueError):
+            registry.get_template('unknown-prompt')
+
+
+def test_model_route_shares_one_deadline_between_its_models():
+    service = service_registry.get(RiskIdentificationService)
+    models = []
+
+    def get_chain(prompt, model_name):
+        models.append(model_name)
+
+        async def ainvoke(inputs, config):
+            await asyncio.sleep(10)
+
+        return type('Chain', (), {'ainvoke': staticmethod(ainvoke)})
+
+    category = Category(name='Technical', description='Technical risks.')
+    query = RiskIdentificationRequest(
+        name='H2 Project', context='Building a H2 cavern.', category=category
+    )
+    prompt = ChatPromptTemplate.from_template('{name}')
+    with (
+        patch.object(service, 'deadline', 0.2),
+        patch.object(service, 'acreate_prompt', return_value=prompt),
+        patch.object(service, 'estimate_prompt_tokens', return_value=10),
+        patch.object(service, 'acquire_rate_limit', return_value=0),
+        patch.object(service, 'get_chain', side_effect=get_chain),
+    ):
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            asyncio.run(service.run_query(query))
+        elapsed = time.monotonic() - start
+
+    assert models == [service.route.primary, *service.route.fallbacks]
+    assert elapsed < 0.4
+
+
+def test_run_query_without_deadline_leaves_the_model_unbounded():
+    service = service_registry.get(RiskIdentificationService)
+    assert service.deadline == settings.LLM_LONG_DEADLINE
+
+    category = Category(name='Technical', description='Technical risks.')
+    query = RiskIdentificationRequest(
+        name='H2 Project', context='Building a H2 cavern.', category=category
+    )
+    prompt = ChatPromptTemplate.from_template('{name}')
+    with (
+        patch.object(service, 'acreate_prompt', return_value=prompt),
+        patch.object(service, 'estimate_prompt_tokens', return_value=10),
+        patch.object(service, 'run_model', side_effect=ValueError('stop')) as mock_run_model,
+    ):
+        with pytest.raises(ValueError):
+            asyncio.run(service.run_query(query, use_deadline=False))
+
+    assert mock_run_model.call_args.args[-1] is None